@@ -0,0 +1,39 @@
+import argparse
+import glob
+import time
+
+from model import HoldDetector
+
+
+def main():
+    # Configuration des arguments
+    parser = argparse.ArgumentParser(description='Débit du détecteur selon la taille des lots')
+    parser.add_argument('--images', type=str, default='data/bh-phone/*.jpg', help='Motif des images à analyser')
+    parser.add_argument('--limit', type=int, default=64, help='Nombre maximal d\'images')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 2, 4, 8, 16], help='Tailles de lots à comparer')
+    parser.add_argument('--num-workers', type=int, nargs='+', default=[0, 2], help='Nombres de threads de décodage à comparer (0: décodage en série)')
+    parser.add_argument('--device', type=str, default='cpu', help='Device à utiliser (cpu ou cuda)')
+    args = parser.parse_args()
+    
+    weights_path = "ml/weights/yolov8_hold_detector.pt"
+    detector = HoldDetector(weights_path, args.device)
+    
+    paths = sorted(glob.glob(args.images))[:args.limit]
+    if not paths:
+        raise FileNotFoundError(f"Aucune image trouvée: {args.images}")
+    
+    # Préchauffage du modèle (l'image annotée n'est jamais demandée, elle n'est donc pas dessinée)
+    detector.predict_batch(paths[:1])
+    
+    print(f"{len(paths)} images, device {args.device}")
+    for num_workers in args.num_workers:
+        for batch_size in args.batch_sizes:
+            start = time.perf_counter()
+            for _ in detector.predict_iter(paths, batch_size=batch_size, num_workers=num_workers):
+                pass
+            elapsed = time.perf_counter() - start
+            
+            print(f"décodage {num_workers} threads, batch {batch_size:3d}: {len(paths) / elapsed:.2f} images/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import argparse
+import glob
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from loader import load_image
+from model import HoldDetector
+
+
+def match_boxes(reference, boxes, classes_ref, classes):
+    """
+    Associe chaque boîte de référence à la boîte de même classe la plus proche (au sens de l'IoU).
+
+    Returns:
+        tuple: Nombre de boîtes associées et écart maximal (en pixels) entre les coordonnées des
+        boîtes associées
+    """
+    if len(reference) == 0 or len(boxes) == 0:
+        return 0, 0.0
+
+    lo = np.maximum(reference[:, None, :2], boxes[None, :, :2])
+    hi = np.minimum(reference[:, None, 2:], boxes[None, :, 2:])
+    inter = np.prod(np.clip(hi - lo, 0, None), axis=2)
+    areas_ref = np.prod(reference[:, 2:] - reference[:, :2], axis=1)
+    areas = np.prod(boxes[:, 2:] - boxes[:, :2], axis=1)
+    iou = inter / np.maximum(areas_ref[:, None] + areas[None] - inter, 1e-9)
+    iou[classes_ref[:, None] != classes[None]] = 0
+
+    matched, max_error = 0, 0.0
+    used = np.zeros(len(boxes), dtype=bool)
+    for i in range(len(reference)):
+        j = int(np.argmax(np.where(used, -1, iou[i])))
+        if used[j] or iou[i, j] < 0.5:
+            continue
+        used[j] = True
+        matched += 1
+        max_error = max(max_error, float(np.abs(reference[i] - boxes[j]).max()))
+
+    return matched, max_error
+
+
+def latency(detector, imgs, repeats):
+    """Renvoie la latence médiane (ms) d'une prédiction sur une image."""
+    detector.predict(imgs[0])
+    times = []
+    for _ in range(repeats):
+        for img in imgs:
+            start = time.perf_counter()
+            detector.predict(img)
+            times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    # Configuration des arguments
+    parser = argparse.ArgumentParser(description='Compare les modèles exportés (ONNX, TorchScript) au modèle ultralytics: boîtes et latence')
+    parser.add_argument('--weights', type=str, default='ml/weights/yolov8_hold_detector.pt', help='Poids du modèle de référence')
+    parser.add_argument('--exported', type=str, nargs='+', required=True, help='Modèles exportés à comparer (.onnx, .torchscript)')
+    parser.add_argument('--images', type=str, default='data/bh-phone/*.jpg', help='Motif des images à analyser')
+    parser.add_argument('--limit', type=int, default=16, help='Nombre maximal d\'images')
+    parser.add_argument('--tolerance', type=float, default=2.0, help='Écart maximal toléré entre les boîtes (pixels)')
+    parser.add_argument('--min-match', type=float, default=0.98, help='Proportion minimale de boîtes de référence retrouvées')
+    parser.add_argument('--repeats', type=int, default=3, help='Nombre de passes pour mesurer la latence')
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(args.images))[:args.limit]
+    if not paths:
+        raise FileNotFoundError(f"Aucune image trouvée: {args.images}")
+    imgs = [load_image(path)[0] for path in paths]
+
+    reference = HoldDetector(args.weights)
+    expected = [reference.predict(img) for img in imgs]
+
+    print(f"{len(imgs)} images")
+    print(f"{args.weights}: {latency(reference, imgs, args.repeats):.1f} ms/image")
+
+    ok = True
+    for path in args.exported:
+        detector = HoldDetector(path)
+
+        # Parité: boîtes de référence retrouvées et écart maximal des coordonnées
+        n_ref, n_matched, n_found, max_error = 0, 0, 0, 0.0
+        for img, ref in zip(imgs, expected):
+            pred = detector.predict(img)
+            matched, error = match_boxes(ref.boxes, pred.boxes, ref.classes, pred.classes)
+            n_ref += len(ref)
+            n_found += len(pred)
+            n_matched += matched
+            max_error = max(max_error, error)
+
+        ratio = n_matched / max(n_ref, 1)
+        passed = ratio >= args.min_match and max_error <= args.tolerance
+        ok &= passed
+
+        print(f"{path}: {latency(detector, imgs, args.repeats):.1f} ms/image, "
+              f"{n_matched}/{n_ref} boîtes retrouvées ({n_found} détectées), "
+              f"écart max {max_error:.2f} px: {'OK' if passed else 'ÉCHEC'}")
+
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
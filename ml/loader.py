@@ -0,0 +1,75 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+
+def load_image(image, max_size=None):
+    """
+    Lit une image et la réduit éventuellement.
+    
+    Args:
+        image (str ou np.ndarray): Chemin vers l'image ou image déjà chargée (format BGR)
+        max_size (int): Taille maximale du plus grand côté (optionnel), l'image est réduite si
+            elle est plus grande
+            
+    Returns:
+        tuple: Image (format BGR) et facteur d'échelle appliqué (1.0 si non réduite)
+    """
+    if isinstance(image, np.ndarray):
+        img = image
+    else:
+        img = cv2.imread(image)
+        if img is None:
+            raise ValueError(f"Impossible de lire l'image: {image}")
+    
+    scale = 1.0
+    if max_size is not None and max(img.shape[:2]) > max_size:
+        scale = max_size / max(img.shape[:2])
+        img = cv2.resize(img, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    
+    return img, scale
+
+
+class ImageLoader:
+    """
+    Décode les images suivantes dans un pool de threads pendant que le modèle traite le lot en
+    cours (OpenCV libère le GIL pendant le décodage).
+    
+    Au plus `prefetch` images décodées sont en attente, la mémoire reste donc bornée. Les images
+    sont renvoyées dans l'ordre, sous la forme (source, image, échelle), où la source est le
+    chemin de l'image ou son indice.
+    
+    Args:
+        images: Itérable de chemins ou d'images (format BGR)
+        num_workers (int): Nombre de threads de décodage
+        prefetch (int): Nombre maximal d'images décodées à l'avance
+        max_size (int): Taille maximale du plus grand côté (optionnel), voir load_image
+    """
+    
+    def __init__(self, images, num_workers=2, prefetch=8, max_size=None):
+        self.images = images
+        self.num_workers = num_workers
+        self.prefetch = prefetch
+        self.max_size = max_size
+        
+    def __iter__(self):
+        executor = ThreadPoolExecutor(self.num_workers)
+        pending = deque()
+        
+        try:
+            for idx, image in enumerate(self.images):
+                source = image if isinstance(image, str) else idx
+                pending.append((source, executor.submit(load_image, image, self.max_size)))
+                
+                if len(pending) > self.prefetch:
+                    source, future = pending.popleft()
+                    yield (source, *future.result())
+            
+            while pending:
+                source, future = pending.popleft()
+                yield (source, *future.result())
+        finally:
+            # Arrêt anticipé du consommateur: les décodages non commencés sont annulés
+            executor.shutdown(cancel_futures=True)
@@ -1,81 +1,177 @@
-from ultralytics import YOLO
-import cv2
+from ultralytics.engine.results import Results
 import numpy as np
 import json
+import torch
+
+from loader import ImageLoader, load_image
+from predictions import Predictions
+from runtime import load_model
+from tiling import tile_boxes, touches_seam, nms
 
 class HoldDetector:
-    def __init__(self, weights_path, device='cpu'):
+    def __init__(self, weights_path, device='cpu', **kwargs):
         """
         Initialise le détecteur de prises d'escalade avec YOLOv8.
         
         Args:
-            weights_path (str): Chemin vers les poids du modèle
+            weights_path (str): Chemin vers les poids du modèle, ou vers un modèle exporté
+                (.onnx pour onnxruntime, .torchscript), plus rapide sur CPU (voir runtime.py)
             device (str): Device à utiliser ('cpu' ou 'cuda')
+            **kwargs: Options du modèle (conf, iou; num_threads pour ONNX), voir runtime.load_model
         """
-        self.model = YOLO(weights_path)
+        self.model = load_model(weights_path, device, **kwargs)
         self.device = device
         self.classes = ["hold", "volume"]
         
-    def predict(self, image_path):
+    def predict(self, image_path, tile_size=None, overlap=128, batch_size=4):
         """
         Effectue la prédiction sur une image.
         
         Args:
             image_path (str): Chemin vers l'image à analyser
+            tile_size (int): Taille des tuiles pour les grandes images (optionnel), voir predict_tiled
+            overlap (int): Chevauchement entre les tuiles
+            batch_size (int): Nombre de tuiles par appel au modèle
             
         Returns:
-            dict: Dictionnaire contenant les prédictions et l'image annotée
+            Predictions: Prédictions (qui s'utilisent aussi comme un dictionnaire contenant les
+            prédictions et l'image annotée, dessinée à la demande)
         """
-        # Lecture de l'image
-        img = cv2.imread(image_path)
-        if img is None:
-            raise ValueError(f"Impossible de lire l'image: {image_path}")
+        img = self._read_image(image_path)
             
         # Prédiction
-        results = self.model(img, device=self.device)[0]
-        
-        # Création de l'image annotée
-        img_holds = img.copy()
-        for box in results.boxes:
-            # Récupération des coordonnées
-            x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-            conf = float(box.conf[0])
-            cls = int(box.cls[0])
+        if tile_size is not None and max(img.shape[:2]) > tile_size:
+            results = self.predict_tiled(img, tile_size, overlap, batch_size, path=image_path)
+        else:
+            results = self.model(img, device=self.device)[0]
+        
+        return Predictions.from_results(results, self.classes, img, source=image_path)
+        
+    def _read_image(self, image):
+        """
+        Lit une image à partir de son chemin (une image déjà chargée est renvoyée telle quelle).
+        
+        Args:
+            image (str ou np.ndarray): Chemin vers l'image ou image (format BGR)
+            
+        Returns:
+            np.ndarray: Image (format BGR)
+        """
+        img, _ = load_image(image)
+        return img
+        
+    def predict_iter(self, images, batch_size=8, num_workers=2, prefetch=8, max_size=None):
+        """
+        Effectue la prédiction sur une suite d'images, par lots, et renvoie les résultats au fur
+        et à mesure (générateur).
+        
+        Seul le lot en cours (et les images décodées à l'avance) est gardé en mémoire, la mémoire
+        reste donc constante quel que soit le nombre d'images. Les images suivantes sont décodées
+        en parallèle de l'inférence (voir ImageLoader).
+        
+        Args:
+            images: Itérable de chemins ou d'images (format BGR)
+            batch_size (int): Nombre d'images par appel au modèle
+            num_workers (int): Nombre de threads de décodage (0 pour décoder en série)
+            prefetch (int): Nombre maximal d'images décodées à l'avance
+            max_size (int): Taille maximale du plus grand côté (optionnel), par exemple la taille
+                d'entrée du modèle; les images plus grandes sont réduites au décodage, et les
+                prédictions sont alors dans les coordonnées de l'image réduite
+            
+        Yields:
+            Predictions: Prédictions de chaque image (voir predict), avec sa source (chemin ou
+            indice de l'image) et son facteur de réduction
+        """
+        if num_workers > 0:
+            loaded = ImageLoader(images, num_workers, prefetch, max_size)
+        else:
+            loaded = ((image if isinstance(image, str) else idx, *load_image(image, max_size))
+                      for idx, image in enumerate(images))
+        
+        batch = []
+        for item in loaded:
+            batch.append(item)
+            
+            if len(batch) == batch_size:
+                yield from self._predict_batch(batch)
+                batch = []
+        
+        if batch:
+            yield from self._predict_batch(batch)
+            
+    def _predict_batch(self, batch):
+        imgs = [img for _, img, _ in batch]
+        for (source, img, scale), results in zip(batch, self.model(imgs, device=self.device)):
+            yield Predictions.from_results(results, self.classes, img, source, scale)
+            
+    def predict_batch(self, images, batch_size=8, **kwargs):
+        """
+        Effectue la prédiction sur une liste d'images, par lots (voir predict_iter).
+        
+        Args:
+            images (list): Chemins ou images (format BGR)
+            batch_size (int): Nombre d'images par appel au modèle
+            **kwargs: Options de décodage de predict_iter (num_workers, prefetch, max_size)
+            
+        Returns:
+            list: Prédictions de chaque image
+        """
+        return list(self.predict_iter(images, batch_size, **kwargs))
+        
+    def predict_tiled(self, img, tile_size=640, overlap=128, batch_size=4, iou_threshold=0.5, path=None):
+        """
+        Effectue la prédiction sur une grande image (panorama) découpée en tuiles qui se chevauchent.
+        
+        Le modèle voit chaque tuile à sa pleine résolution (imgsz = tile_size), les prises ne sont
+        donc pas réduites comme sur l'image entière, et la mémoire utilisée par le modèle dépend
+        de la taille des tuiles et non de celle de l'image. Les détections des différentes tuiles sont fusionnées par une suppression des
+        non-maxima entre tuiles; une prise coupée par une couture est remplacée par sa copie entière
+        de la tuile voisine, le chevauchement doit donc être plus grand que les plus grandes prises.
+        
+        Args:
+            img (np.ndarray): Image (format BGR)
+            tile_size (int): Largeur et hauteur des tuiles
+            overlap (int): Chevauchement minimal entre deux tuiles voisines
+            batch_size (int): Nombre de tuiles par appel au modèle
+            iou_threshold (float): Seuil de la suppression des non-maxima
+            path (str): Chemin de l'image (optionnel)
             
-            # Dessin de la boîte
-            color = (0, 255, 0) if cls == 0 else (255, 0, 0)  # Vert pour hold, Rouge pour volume
-            cv2.rectangle(img_holds, (int(x1), int(y1)), (int(x2), int(y2)), color, 2)
+        Returns:
+            Results: Prédictions fusionnées, en coordonnées de l'image
+        """
+        tiles = tile_boxes(img.shape, tile_size, overlap)
+        
+        detections, groups, scores = [], [], []
+        for start in range(0, len(tiles), batch_size):
+            batch = tiles[start:start + batch_size]
+            crops = [img[y1:y2, x1:x2] for x1, y1, x2, y2 in batch]
             
-            # Ajout du label
-            label = f"{self.classes[cls]} {conf:.2f}"
-            cv2.putText(img_holds, label, (int(x1), int(y1)-10), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+            for t, (tile, results) in enumerate(zip(batch, self.model(crops, device=self.device, imgsz=tile_size)), start):
+                # Colonnes: x1, y1, x2, y2, confiance, classe
+                data = results.boxes.data.cpu().numpy().astype(np.float64)
+                data[:, :4] += np.tile(tile[:2], 2)
+                
+                # Les boîtes coupées par une couture passent après toutes les boîtes entières
+                scores.append(data[:, 4] - touches_seam(data[:, :4], tile, img.shape))
+                detections.append(data)
+                groups.append(np.full(len(data), t))
+        
+        data = np.concatenate(detections)
+        keep = nms(data[:, :4], np.concatenate(scores), data[:, 5], iou_threshold,
+                   groups=np.concatenate(groups), metric="ios")
         
-        return {
-            "outputs": results,
-            "original_image": img,
-            "annotated_image": img_holds
-        }
+        return Results(img, path=path, names=self.model.names, boxes=torch.from_numpy(data[keep]))
         
     def save_predictions_to_json(self, outputs, output_path):
         """
         Sauvegarde les prédictions au format JSON.
         
         Args:
-            outputs: Sortie du modèle YOLO
+            outputs: Prédictions (Predictions) ou sortie du modèle YOLO
             output_path (str): Chemin où sauvegarder le fichier JSON
         """
-        predictions = []
-        
-        for box in outputs.boxes:
-            x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-            pred = {
-                "bbox": [float(x1), float(y1), float(x2), float(y2)],
-                "score": float(box.conf[0]),
-                "category_id": int(box.cls[0]),
-                "category_name": self.classes[int(box.cls[0])]
-            }
-            predictions.append(pred)
+        if not isinstance(outputs, Predictions):
+            outputs = Predictions.from_results(outputs, self.classes)
             
         with open(output_path, 'w') as f:
-            json.dump({"predictions": predictions}, f, indent=2) 
\ No newline at end of file
+            json.dump({"predictions": outputs.to_dicts()}, f, indent=2)
@@ -1,6 +1,7 @@
 import cv2
 import matplotlib.pyplot as plt
 from model import HoldDetector
+from predictions import Predictions
 import os
 
 def visualize_predictions(image, predictions, output_path=None):
@@ -12,26 +13,8 @@ def visualize_predictions(image, predictions, output_path=None):
         predictions: Sortie du modèle YOLO
         output_path: Chemin pour sauvegarder la visualisation (optionnel)
     """
-    # Création de l'image annotée
-    img_holds = image.copy()
-    
-    # Dessin des boîtes et labels
-    for box in predictions.boxes:
-        # Récupération des coordonnées
-        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-        conf = float(box.conf[0])
-        cls = int(box.cls[0])
-        
-        # Couleur selon la classe (vert pour hold, rouge pour volume)
-        color = (0, 255, 0) if cls == 0 else (255, 0, 0)
-        
-        # Dessin de la boîte
-        cv2.rectangle(img_holds, (int(x1), int(y1)), (int(x2), int(y2)), color, 2)
-        
-        # Ajout du label
-        label = f"{'hold' if cls == 0 else 'volume'} {conf:.2f}"
-        cv2.putText(img_holds, label, (int(x1), int(y1)-10), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+    # Création de l'image annotée (boîtes extraites en un seul transfert)
+    img_holds = Predictions.from_results(predictions, ["hold", "volume"], image).annotated_image
     
     # Création de la figure avec matplotlib
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 5))
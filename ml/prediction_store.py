@@ -0,0 +1,240 @@
+import json
+import os
+
+import numpy as np
+
+from predictions import Predictions
+
+
+class NdjsonWriter:
+    """
+    Écrit les prédictions au format NDJSON: une ligne JSON par image, en mode ajout (un fichier
+    existant est complété).
+
+    Chaque ligne contient la source de l'image et les boîtes, scores et classes sous forme de
+    listes (une par colonne), ce qui est bien plus compact qu'un dictionnaire par boîte.
+
+    Args:
+        path (str): Chemin du fichier NDJSON
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "a")
+
+    def write(self, predictions):
+        """
+        Ajoute les prédictions d'une image.
+
+        Args:
+            predictions (Predictions): Prédictions de l'image
+        """
+        line = {
+            "source": predictions.source,
+            "bbox": np.round(predictions.boxes, 2).tolist(),
+            "score": np.round(predictions.scores, 4).tolist(),
+            "category_id": predictions.classes.tolist()
+        }
+        self.file.write(json.dumps(line, separators=(",", ":")) + "\n")
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_ndjson(path, class_names=("hold", "volume")):
+    """
+    Lit un fichier NDJSON écrit par NdjsonWriter, image par image (générateur).
+
+    Args:
+        path (str): Chemin du fichier NDJSON
+        class_names (list): Noms des classes
+
+    Yields:
+        Predictions: Prédictions de chaque image
+    """
+    with open(path) as f:
+        for line in f:
+            # La dernière ligne peut être incomplète si l'écriture a été interrompue
+            try:
+                d = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            yield Predictions(d["bbox"], d["score"], d["category_id"], list(class_names), source=d["source"])
+
+
+# Colonnes du format colonnaire: nom -> (type, nombre de valeurs par ligne)
+COLUMNS = {
+    "boxes": ("<f4", 4),
+    "scores": ("<f4", 1),
+    "classes": ("<i4", 1),
+}
+
+
+class ColumnarWriter:
+    """
+    Écrit les prédictions au format colonnaire: un dossier contenant un fichier binaire brut par
+    colonne (boîtes, scores, classes, toutes images confondues), le nombre de boîtes de chaque
+    image (les offsets en sont la somme cumulée) et la source de chaque image.
+
+    Les fichiers sont écrits en mode ajout, un dossier existant est donc complété; si une
+    écriture a été interrompue, les lignes qui dépassent le nombre de boîtes enregistré sont
+    supprimées à l'ouverture. Voir ColumnarReader pour la lecture.
+
+    Args:
+        directory (str): Dossier des prédictions
+        class_names (list): Noms des classes
+    """
+
+    def __init__(self, directory, class_names=("hold", "volume")):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+
+        meta_path = os.path.join(directory, "meta.json")
+        if not os.path.exists(meta_path):
+            with open(meta_path, "w") as f:
+                json.dump({"class_names": list(class_names), "columns": COLUMNS}, f)
+
+        self._repair()
+
+        self.files = {name: open(self._path(name), "ab") for name in list(COLUMNS) + ["counts"]}
+        self.sources = open(os.path.join(directory, "sources.txt"), "a")
+
+    def _path(self, name):
+        return os.path.join(self.directory, f"{name}.bin")
+
+    def _repair(self):
+        """Tronque les fichiers au dernier état cohérent (images complètes uniquement)."""
+        counts_path = self._path("counts")
+        sources_path = os.path.join(self.directory, "sources.txt")
+        if not os.path.exists(counts_path):
+            return
+
+        with open(sources_path) as f:
+            n_sources = sum(1 for line in f if line.endswith("\n"))
+
+        counts = np.fromfile(counts_path, dtype="<i8")
+
+        # Les fichiers sont bufferisés séparément: on ne garde que les images dont toutes les
+        # colonnes sont complètes
+        rows = min(
+            os.path.getsize(self._path(name)) // (width * np.dtype(dtype).itemsize)
+            if os.path.exists(self._path(name)) else 0
+            for name, (dtype, width) in COLUMNS.items()
+        )
+        ends = np.cumsum(counts)
+        n_images = min(int(np.searchsorted(ends, rows, side="right")), n_sources)
+        n_rows = int(ends[n_images - 1]) if n_images > 0 else 0
+
+        os.truncate(counts_path, n_images * 8)
+        for name, (dtype, width) in COLUMNS.items():
+            if os.path.exists(self._path(name)):
+                os.truncate(self._path(name), n_rows * width * np.dtype(dtype).itemsize)
+
+        with open(sources_path) as f:
+            lines = f.readlines()[:n_images]
+        with open(sources_path, "w") as f:
+            f.writelines(lines)
+
+    def write(self, predictions):
+        """
+        Ajoute les prédictions d'une image.
+
+        Args:
+            predictions (Predictions): Prédictions de l'image
+        """
+        self.files["boxes"].write(predictions.boxes.astype("<f4").tobytes())
+        self.files["scores"].write(predictions.scores.astype("<f4").tobytes())
+        self.files["classes"].write(predictions.classes.astype("<i4").tobytes())
+        # Le nombre de boîtes est écrit en dernier, il valide les lignes de l'image
+        self.files["counts"].write(np.array([len(predictions)], dtype="<i8").tobytes())
+        self.sources.write(f"{predictions.source}\n")
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.sources.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ColumnarReader:
+    """
+    Lit les prédictions écrites par ColumnarWriter, avec des fichiers projetés en mémoire
+    (np.memmap): les prédictions d'une image sont lues sans charger le reste du fichier.
+
+    Args:
+        directory (str): Dossier des prédictions
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        self.class_names = meta["class_names"]
+
+        with open(os.path.join(directory, "sources.txt")) as f:
+            self.sources = [line.rstrip("\n") for line in f if line.endswith("\n")]
+
+        counts = np.fromfile(os.path.join(directory, "counts.bin"), dtype="<i8")
+        counts = counts[:len(self.sources)]
+        self.sources = self.sources[:len(counts)]
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+        self.columns = {}
+        for name, (dtype, width) in meta["columns"].items():
+            n_rows = int(self.offsets[-1])
+            if n_rows == 0:
+                self.columns[name] = np.zeros((0, width), dtype=dtype)
+            else:
+                self.columns[name] = np.memmap(os.path.join(directory, f"{name}.bin"), dtype=dtype,
+                                               mode="r", shape=(n_rows, width))
+
+        self._index = None
+
+    def __len__(self):
+        return len(self.sources)
+
+    def __getitem__(self, i):
+        """
+        Renvoie les prédictions de l'image d'indice i.
+
+        Returns:
+            Predictions: Prédictions de l'image
+        """
+        if not -len(self) <= i < len(self):
+            raise IndexError("indice d'image hors limites")
+        i %= len(self)
+
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return Predictions(
+            np.array(self.columns["boxes"][start:end]),
+            np.array(self.columns["scores"][start:end, 0]),
+            np.array(self.columns["classes"][start:end, 0]),
+            self.class_names,
+            source=self.sources[i]
+        )
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def get(self, source):
+        """
+        Renvoie les prédictions d'une image à partir de sa source (chemin).
+
+        Returns:
+            Predictions: Prédictions de l'image
+        """
+        if self._index is None:
+            self._index = {s: i for i, s in enumerate(self.sources)}
+        return self[self._index[source]]
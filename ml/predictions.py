@@ -0,0 +1,119 @@
+import cv2
+import numpy as np
+
+
+def annotate_image(img, boxes, scores, classes, class_names):
+    """
+    Dessine les boîtes et les labels des prédictions sur une copie de l'image.
+    
+    Args:
+        img (np.ndarray): Image (format BGR)
+        boxes (np.ndarray): Boîtes (n, 4) au format xyxy
+        scores (np.ndarray): Scores (n,)
+        classes (np.ndarray): Classes (n,)
+        class_names (list): Noms des classes
+        
+    Returns:
+        np.ndarray: Image annotée
+    """
+    img_holds = img.copy()
+    for (x1, y1, x2, y2), conf, cls in zip(boxes.astype(int).tolist(), scores.tolist(), classes.tolist()):
+        # Dessin de la boîte
+        color = (0, 255, 0) if cls == 0 else (255, 0, 0)  # Vert pour hold, Rouge pour volume
+        cv2.rectangle(img_holds, (x1, y1), (x2, y2), color, 2)
+        
+        # Ajout du label
+        label = f"{class_names[cls]} {conf:.2f}"
+        cv2.putText(img_holds, label, (x1, y1-10), 
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+    return img_holds
+
+
+class Predictions:
+    """
+    Prédictions d'une image, sous forme de tableaux numpy (boîtes, scores, classes).
+    
+    Les tableaux sont extraits de la sortie du modèle en un seul transfert par tableau, et
+    l'image annotée n'est dessinée que lorsqu'elle est demandée (puis gardée), un traitement sans
+    visualisation ne paie donc rien pour elle. Pour la compatibilité, l'objet s'utilise aussi
+    comme le dictionnaire renvoyé auparavant par predict (results["annotated_image"], ...).
+    
+    Args:
+        boxes (np.ndarray): Boîtes (n, 4) au format xyxy
+        scores (np.ndarray): Scores (n,)
+        classes (np.ndarray): Classes (n,)
+        class_names (list): Noms des classes
+        original_image (np.ndarray): Image (format BGR, optionnelle)
+        outputs: Sortie du modèle YOLO (optionnelle)
+        source: Chemin ou indice de l'image (optionnel)
+        scale (float): Facteur de réduction de l'image au décodage
+    """
+    
+    KEYS = ("source", "scale", "outputs", "original_image", "annotated_image")
+    
+    def __init__(self, boxes, scores, classes, class_names, original_image=None, outputs=None,
+                 source=None, scale=1.0):
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+        self.classes = np.asarray(classes, dtype=np.int64).reshape(-1)
+        self.class_names = class_names
+        self.original_image = original_image
+        self.outputs = outputs
+        self.source = source
+        self.scale = scale
+        self._annotated_image = None
+        
+    @classmethod
+    def from_results(cls, results, class_names, original_image=None, source=None, scale=1.0):
+        """
+        Extrait les prédictions de la sortie du modèle YOLO (ou d'un objet Results).
+        
+        Args:
+            results: Sortie du modèle YOLO pour une image
+            class_names (list): Noms des classes
+            
+        Returns:
+            Predictions: Prédictions de l'image
+        """
+        boxes = results.boxes
+        return cls(
+            boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(), boxes.cls.cpu().numpy(),
+            class_names, original_image, results, source, scale
+        )
+        
+    def __len__(self):
+        return len(self.boxes)
+        
+    @property
+    def annotated_image(self):
+        """Image annotée, dessinée au premier accès."""
+        if self._annotated_image is None and self.original_image is not None:
+            self._annotated_image = annotate_image(
+                self.original_image, self.boxes, self.scores, self.classes, self.class_names
+            )
+        return self._annotated_image
+        
+    def __getitem__(self, key):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+        
+    def keys(self):
+        return self.KEYS
+        
+    def to_dicts(self):
+        """
+        Convertit les prédictions en dictionnaires (format de save_predictions_to_json).
+        
+        Returns:
+            list: Un dictionnaire par boîte
+        """
+        return [
+            {
+                "bbox": box,
+                "score": score,
+                "category_id": cls,
+                "category_name": self.class_names[cls]
+            }
+            for box, score, cls in zip(self.boxes.tolist(), self.scores.tolist(), self.classes.tolist())
+        ]
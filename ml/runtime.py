@@ -0,0 +1,283 @@
+import abc
+import ast
+import json
+import os
+
+import cv2
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+
+from tiling import nms
+
+
+def letterbox(img, size, color=(114, 114, 114)):
+    """
+    Redimensionne une image en gardant ses proportions et la complète par des bandes pour
+    atteindre la taille d'entrée du modèle (même prétraitement qu'ultralytics).
+
+    Args:
+        img (np.ndarray): Image (format BGR)
+        size (tuple): Hauteur et largeur d'entrée du modèle
+        color (tuple): Couleur des bandes
+
+    Returns:
+        tuple: Image redimensionnée, facteur d'échelle et décalage (x, y) des bandes
+    """
+    h, w = img.shape[:2]
+    gain = min(size[0] / h, size[1] / w)
+    new_w, new_h = int(round(w * gain)), int(round(h * gain))
+
+    if (new_w, new_h) != (w, h):
+        img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+    dw, dh = (size[1] - new_w) / 2, (size[0] - new_h) / 2
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+
+    return img, gain, (left, top)
+
+
+def postprocess(output, gain, pad, shape, conf=0.25, iou=0.7, max_det=300):
+    """
+    Décode la sortie brute d'un modèle YOLOv8 exporté et applique la suppression des non-maxima
+    par classe (mêmes seuils par défaut qu'ultralytics).
+
+    Args:
+        output (np.ndarray): Sortie du modèle pour une image (4 + nombre de classes, n), les
+            boîtes au format (cx, cy, w, h) suivies du score de chaque classe
+        gain (float): Facteur d'échelle du prétraitement (voir letterbox)
+        pad (tuple): Décalage (x, y) des bandes
+        shape (tuple): Forme de l'image originale
+        conf (float): Seuil de confiance
+        iou (float): Seuil de la suppression des non-maxima
+        max_det (int): Nombre maximal de détections
+
+    Returns:
+        np.ndarray: Détections (n, 6): x1, y1, x2, y2, confiance, classe, en coordonnées de
+        l'image originale
+    """
+    output = output.T
+    class_scores = output[:, 4:]
+    classes = class_scores.argmax(axis=1)
+    scores = class_scores[np.arange(len(output)), classes]
+
+    mask = scores > conf
+    xywh, scores, classes = output[mask, :4], scores[mask], classes[mask]
+
+    boxes = np.concatenate([xywh[:, :2] - xywh[:, 2:] / 2, xywh[:, :2] + xywh[:, 2:] / 2], axis=1)
+
+    keep = nms(boxes, scores, classes, iou)
+    keep = keep[np.argsort(-scores[keep], kind="stable")][:max_det]
+    boxes, scores, classes = boxes[keep], scores[keep], classes[keep]
+
+    # Retour aux coordonnées de l'image originale
+    boxes = (boxes - np.tile(pad, 2)) / gain
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, shape[1])
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, shape[0])
+
+    return np.concatenate([boxes, scores[:, None], classes[:, None]], axis=1).astype(np.float32)
+
+
+class ExportedModel(abc.ABC):
+    """
+    Modèle YOLOv8 exporté, utilisable à la place du modèle ultralytics (YOLO) par HoldDetector:
+    un appel sur une liste d'images renvoie une liste de Results, avec le prétraitement et la
+    suppression des non-maxima faits ici plutôt que par ultralytics.
+
+    Args:
+        path (str): Chemin du modèle exporté
+        conf (float): Seuil de confiance
+        iou (float): Seuil de la suppression des non-maxima
+        names (dict): Noms des classes, si le modèle ne les contient pas
+    """
+
+    def __init__(self, path, conf=0.25, iou=0.7, names=None):
+        self.path = path
+        self.conf = conf
+        self.iou = iou
+
+        metadata = self._metadata()
+        self.names = metadata.get("names") or names or {0: "hold", 1: "volume"}
+        self.names = {int(k): v for k, v in self.names.items()}
+
+        imgsz = metadata.get("imgsz", 640)
+        self.imgsz = tuple(imgsz) if isinstance(imgsz, (list, tuple)) else (imgsz, imgsz)
+
+    def _metadata(self):
+        return {}
+
+    @abc.abstractmethod
+    def _forward(self, batch):
+        """Renvoie la sortie brute (b, 4 + nombre de classes, n) d'un lot (b, 3, h, w)."""
+
+    def _input_size(self, imgsz):
+        return self.imgsz if imgsz is None else (imgsz, imgsz)
+
+    def _batch_size(self):
+        """Taille de lot fixée par le modèle exporté (None si elle est dynamique)."""
+        return None
+
+    def __call__(self, imgs, device=None, imgsz=None, **kwargs):
+        """
+        Effectue la prédiction sur une ou plusieurs images.
+
+        Args:
+            imgs: Image ou liste d'images (format BGR)
+            device (str): Ignoré, le device est choisi au chargement du modèle
+            imgsz (int): Taille d'entrée (ignorée si le modèle a une taille fixe)
+
+        Returns:
+            list: Results de chaque image
+        """
+        if isinstance(imgs, np.ndarray):
+            imgs = [imgs]
+
+        size = self._input_size(imgsz)
+        letterboxed = [letterbox(img, size) for img in imgs]
+
+        # BGR -> RGB, HWC -> CHW, [0, 1]
+        batch = np.stack([img for img, _, _ in letterboxed])[..., ::-1].transpose(0, 3, 1, 2)
+        batch = np.ascontiguousarray(batch, dtype=np.float32) / 255
+
+        step = self._batch_size() or len(batch)
+        outputs = np.concatenate([self._forward(batch[i:i + step]) for i in range(0, len(batch), step)])
+
+        results = []
+        for img, (_, gain, pad), output in zip(imgs, letterboxed, outputs):
+            data = postprocess(output, gain, pad, img.shape, self.conf, self.iou)
+            results.append(Results(img, path=self.path, names=self.names, boxes=torch.from_numpy(data)))
+
+        return results
+
+
+class OnnxModel(ExportedModel):
+    """
+    Modèle exporté au format ONNX (model.export(format='onnx')), exécuté par onnxruntime.
+
+    Args:
+        path (str): Chemin du fichier .onnx
+        device (str): Device à utiliser ('cpu' ou 'cuda')
+        num_threads (int): Nombre de threads d'inférence (optionnel, par défaut tous les cœurs)
+        **kwargs: Voir ExportedModel
+    """
+
+    def __init__(self, path, device='cpu', num_threads=None, **kwargs):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+
+        providers = ["CPUExecutionProvider"]
+        if device.startswith("cuda"):
+            providers.insert(0, "CUDAExecutionProvider")
+
+        self.session = ort.InferenceSession(path, options, providers=providers)
+        self.input = self.session.get_inputs()[0]
+        super().__init__(path, **kwargs)
+
+    def _metadata(self):
+        # Les métadonnées écrites par ultralytics sont des chaînes (repr de dictionnaires et listes)
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        return {k: ast.literal_eval(metadata[k]) for k in ("names", "imgsz") if k in metadata}
+
+    def _input_size(self, imgsz):
+        # Taille fixe, sauf si le modèle a été exporté avec dynamic=True
+        h, w = self.input.shape[2:]
+        if isinstance(h, int) and isinstance(w, int):
+            return h, w
+        return super()._input_size(imgsz)
+
+    def _batch_size(self):
+        b = self.input.shape[0]
+        return b if isinstance(b, int) else None
+
+    def _forward(self, batch):
+        return self.session.run(None, {self.input.name: batch})[0]
+
+
+class TorchScriptModel(ExportedModel):
+    """
+    Modèle exporté au format TorchScript (model.export(format='torchscript')).
+
+    Args:
+        path (str): Chemin du fichier .torchscript
+        device (str): Device à utiliser ('cpu' ou 'cuda')
+        **kwargs: Voir ExportedModel
+    """
+
+    def __init__(self, path, device='cpu', **kwargs):
+        self.device = device
+        self.extra_files = {"config.txt": ""}
+        self.module = torch.jit.load(path, map_location=device, _extra_files=self.extra_files)
+        self.module.eval()
+        super().__init__(path, **kwargs)
+
+    def _metadata(self):
+        config = self.extra_files["config.txt"]
+        return json.loads(config) if config else {}
+
+    def _input_size(self, imgsz):
+        # La trace est faite à la taille d'export (les ancres y sont figées): les images sont
+        # toujours ramenées à cette taille, quelle que soit celle demandée (par exemple les tuiles)
+        return self.imgsz
+
+    def _forward(self, batch):
+        with torch.inference_mode():
+            output = self.module(torch.from_numpy(batch).to(self.device))
+        if isinstance(output, (list, tuple)):
+            output = output[0]
+        return output.float().cpu().numpy()
+
+
+class UltralyticsModel:
+    """
+    Modèle ultralytics (poids .pt), avec les seuils passés à chaque appel (ultralytics ne les
+    garde pas d'un appel à l'autre).
+
+    Args:
+        path (str): Chemin des poids
+        conf (float): Seuil de confiance
+        iou (float): Seuil de la suppression des non-maxima
+    """
+
+    def __init__(self, path, conf=0.25, iou=0.7):
+        from ultralytics import YOLO
+
+        self.model = YOLO(path)
+        self.conf = conf
+        self.iou = iou
+
+    @property
+    def names(self):
+        return self.model.names
+
+    def __call__(self, imgs, **kwargs):
+        return self.model(imgs, conf=self.conf, iou=self.iou, **kwargs)
+
+
+def load_model(weights_path, device='cpu', **kwargs):
+    """
+    Charge un modèle selon l'extension de son fichier: .onnx (onnxruntime), .torchscript
+    (TorchScript) ou poids ultralytics (.pt).
+
+    Args:
+        weights_path (str): Chemin du modèle
+        device (str): Device à utiliser ('cpu' ou 'cuda')
+        **kwargs: Options du modèle: conf et iou pour tous, names pour les modèles exportés,
+            num_threads pour ONNX (une option non prise en charge lève une TypeError)
+
+    Returns:
+        Modèle appelable sur une liste d'images et renvoyant des Results
+    """
+    ext = os.path.splitext(weights_path)[1].lower()
+    if ext == ".onnx":
+        return OnnxModel(weights_path, device, **kwargs)
+    if ext == ".torchscript":
+        return TorchScriptModel(weights_path, device, **kwargs)
+
+    # le device est passé à chaque appel par HoldDetector
+    return UltralyticsModel(weights_path, **kwargs)
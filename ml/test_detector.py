@@ -3,12 +3,46 @@ import matplotlib.pyplot as plt
 from model import HoldDetector
 import os
 
+def save_results(detector, results, output):
+    """
+    Sauvegarde les prédictions en JSON et la visualisation d'une image.
+    
+    Args:
+        detector (HoldDetector): Détecteur
+        results (dict): Résultats de predict
+        output (str): Préfixe des fichiers de sortie
+    """
+    # Sauvegarde des prédictions en JSON
+    json_path = f"{output}_predictions.json"
+    detector.save_predictions_to_json(results, json_path)
+    print(f"Prédictions sauvegardées dans: {json_path}")
+    
+    # Affichage des résultats
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 5))
+    
+    # Image originale
+    ax1.imshow(results["original_image"][:, :, ::-1])
+    ax1.axis('off')
+    ax1.set_title('Image originale')
+    
+    # Image avec détections
+    ax2.imshow(results["annotated_image"][:, :, ::-1])
+    ax2.axis('off')
+    ax2.set_title('Détections')
+    
+    # Sauvegarde de la figure
+    plt.savefig(f"{output}_visualization.png")
+    print(f"Visualisation sauvegardée dans: {output}_visualization.png")
+
 def main():
     # Configuration des arguments
     parser = argparse.ArgumentParser(description='Test du détecteur de prises d\'escalade')
-    parser.add_argument('--image', type=str, required=True, help='Chemin vers l\'image à analyser')
+    parser.add_argument('--image', type=str, nargs='+', required=True, help='Chemin vers l\'image à analyser (ou plusieurs images)')
     parser.add_argument('--output', type=str, default='output', help='Préfixe pour les fichiers de sortie')
     parser.add_argument('--device', type=str, default='cpu', help='Device à utiliser (cpu ou cuda)')
+    parser.add_argument('--tile-size', type=int, default=None, help='Taille des tuiles pour les grandes images (panoramas)')
+    parser.add_argument('--batch-size', type=int, default=4, help='Nombre d\'images par lot (plusieurs images)')
+    parser.add_argument('--num-workers', type=int, default=2, help='Nombre de threads de décodage des images suivantes')
     args = parser.parse_args()
     
     # Chemin du fichier de poids
@@ -17,41 +51,29 @@ def main():
     # Vérification des fichiers
     if not os.path.exists(weights_path):
         raise FileNotFoundError(f"Fichier de poids non trouvé: {weights_path}")
-    if not os.path.exists(args.image):
-        raise FileNotFoundError(f"Image non trouvée: {args.image}")
+    for image in args.image:
+        if not os.path.exists(image):
+            raise FileNotFoundError(f"Image non trouvée: {image}")
     
     # Initialisation du détecteur
     print("Initialisation du détecteur...")
     detector = HoldDetector(weights_path, args.device)
     
     # Prédiction
-    print(f"Analyse de l'image: {args.image}")
-    results = detector.predict(args.image)
-    
-    # Sauvegarde des prédictions en JSON
-    json_path = f"{args.output}_predictions.json"
-    detector.save_predictions_to_json(results["outputs"], json_path)
-    print(f"Prédictions sauvegardées dans: {json_path}")
-    
-    # Affichage des résultats
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 5))
-    
-    # Image originale
-    ax1.imshow(results["original_image"][:, :, ::-1])
-    ax1.axis('off')
-    ax1.set_title('Image originale')
-    
-    # Image avec détections
-    ax2.imshow(results["annotated_image"][:, :, ::-1])
-    ax2.axis('off')
-    ax2.set_title('Détections')
-    
-    # Sauvegarde de la figure
-    plt.savefig(f"{args.output}_visualization.png")
-    print(f"Visualisation sauvegardée dans: {args.output}_visualization.png")
+    if len(args.image) == 1:
+        print(f"Analyse de l'image: {args.image[0]}")
+        results = detector.predict(args.image[0], tile_size=args.tile_size)
+        save_results(detector, results, args.output)
+    else:
+        # Les images suivantes sont décodées pendant l'inférence du lot en cours
+        for results in detector.predict_iter(args.image, batch_size=args.batch_size, num_workers=args.num_workers):
+            print(f"Analyse de l'image: {results['source']}")
+            stem = os.path.splitext(os.path.basename(results["source"]))[0]
+            save_results(detector, results, f"{args.output}_{stem}")
+            plt.close()
     
     # Affichage si demandé
     plt.show()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
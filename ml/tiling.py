@@ -0,0 +1,77 @@
+import numpy as np
+
+# La grille de tuiles est celle du traitement par tuiles de std (mêmes bornes et chevauchements)
+from std.tiling import tile_boxes
+
+
+def touches_seam(boxes, tile, shape, margin=2):
+    """
+    Indique les boîtes coupées par un bord intérieur de la tuile (qui n'est pas un bord de l'image).
+
+    Args:
+        boxes (np.ndarray): Boîtes (n, 4) en coordonnées de l'image
+        tile (tuple): Boîte de la tuile
+        shape (tuple): Dimensions de l'image
+        margin (int): Distance au bord en dessous de laquelle une boîte est considérée coupée
+
+    Returns:
+        np.ndarray: Masque booléen (n,)
+    """
+    h, w = shape[:2]
+    x1, y1, x2, y2 = tile
+
+    return (
+        ((x1 > 0) & (boxes[:, 0] - x1 < margin))
+        | ((y1 > 0) & (boxes[:, 1] - y1 < margin))
+        | ((x2 < w) & (x2 - boxes[:, 2] < margin))
+        | ((y2 < h) & (y2 - boxes[:, 3] < margin))
+    )
+
+
+def nms(boxes, scores, classes, threshold=0.5, groups=None, metric="iou"):
+    """
+    Suppression des non-maxima, par classe.
+
+    Args:
+        boxes (np.ndarray): Boîtes (n, 4) au format xyxy
+        scores (np.ndarray): Scores (n,)
+        classes (np.ndarray): Classes (n,)
+        threshold (float): Recouvrement au-dessus duquel une boîte est supprimée
+        groups (np.ndarray): Groupe de chaque boîte (optionnel), seules les boîtes de groupes
+            différents se suppriment (par exemple les tuiles, déjà filtrées par le modèle)
+        metric (str): 'iou' (intersection sur union) ou 'ios' (intersection sur la plus petite
+            boîte, qui supprime une prise coupée par une couture au profit de sa copie entière)
+
+    Returns:
+        np.ndarray: Indices des boîtes conservées, triés
+    """
+    if metric not in ("iou", "ios"):
+        raise ValueError(f"Métrique inconnue: {metric}")
+
+    boxes = np.asarray(boxes, dtype=np.float64)
+    areas = np.prod(np.clip(boxes[:, 2:] - boxes[:, :2], 0, None), axis=1)
+    order = np.argsort(-np.asarray(scores), kind="stable")
+
+    keep = []
+    suppressed = np.zeros(len(boxes), dtype=bool)
+    for i in order.tolist():
+        if suppressed[i]:
+            continue
+        keep.append(i)
+
+        # Recouvrement avec toutes les boîtes restantes de la même classe
+        lo = np.maximum(boxes[i, :2], boxes[:, :2])
+        hi = np.minimum(boxes[i, 2:], boxes[:, 2:])
+        inter = np.prod(np.clip(hi - lo, 0, None), axis=1)
+
+        if metric == "iou":
+            overlap = inter / np.maximum(areas[i] + areas - inter, 1e-9)
+        else:
+            overlap = inter / np.maximum(np.minimum(areas[i], areas), 1e-9)
+
+        candidates = (classes == classes[i]) & (overlap > threshold)
+        if groups is not None:
+            candidates &= groups != groups[i]
+        suppressed |= candidates
+
+    return np.sort(np.array(keep, dtype=np.int64))
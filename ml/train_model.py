@@ -32,8 +32,10 @@ def main():
         name='hold_detector'
     )
     
-    # Sauvegarder le modèle final
-    model.export(format='pt')
+    # Exporter le modèle final pour l'inférence sur CPU (voir runtime.py); les poids .pt sont
+    # sauvegardés par l'entraînement
+    model.export(format='onnx', imgsz=640)
+    model.export(format='torchscript', imgsz=640)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -10,10 +10,11 @@ import torch
 from detectron2.structures import BoxMode
 from imantics import Mask
 from torch.utils.data import random_split
-from detectron2.structures import polygons_to_bitmask
 from tqdm import tqdm
 import matplotlib.pyplot as plt
 
+from std.routes import RouteRenderer
+
 
 def cp_files(file_list: List[str], destination: str) -> None:
     for f in file_list:
@@ -231,77 +232,48 @@ def annotate_polygons(
         json.dump(data, f)
 
 
-def plot_routes(routes_dict, image_obj):
-    """
-    Plots routes based on route_dict and image_obj
-
-    @param routes_dict: Dictionary with list of instance indices per key e.g. {0: [0,1,2]}
-    @param image_obj: Image object created by create_dataset_dicts
-    """
+def _plot_route_views(renderer, routes_dict):
     figures_axes = []
-    for route_id, holds in routes_dict.items():
-        img_orig = cv2.imread(image_obj["file_name"])
-        img = torch.tensor(img_orig).permute(2, 0, 1)
-        final_bitmask = torch.zeros_like(img)
-        for hold_idx in holds:
-            poly = image_obj["annotations"][hold_idx]
-            bitmask = torch.tensor(
-                polygons_to_bitmask(
-                    poly["segmentation"],
-                    height=image_obj["height"],
-                    width=image_obj["width"],
-                )
-            ).int()
-            final_bitmask = final_bitmask + bitmask
-        final_bitmask = final_bitmask.bool().float()
-        masked_output = img * final_bitmask
-        img_routes = masked_output.int().permute(1, 2, 0).cpu().detach().numpy()
+    for route_id, img_routes in renderer.render_routes(routes_dict):
         fig, ax = plt.subplots(ncols=2)
-        img_routes = cv2.resize(
-            img_routes, (0, 0), fx=0.25, fy=0.25, interpolation=cv2.INTER_LINEAR_EXACT
-        )
-        img_orig = cv2.resize(
-            img_orig, (0, 0), fx=0.25, fy=0.25, interpolation=cv2.INTER_LINEAR_EXACT
-        )
         ax[0].imshow(img_routes[:, :, ::-1])
         ax[0].axis("off")
-        ax[1].imshow(img_orig[:, :, ::-1])
+        ax[1].imshow(renderer.image[:, :, ::-1])
         ax[1].axis("off")
         figures_axes.append((fig, ax))
     return figures_axes
 
 
-def plot_routes_instances(routes_dict, instances, img):
+def plot_routes(routes_dict, image_obj, output_dir=None, scale=0.25):
+    """
+    Plots routes based on route_dict and image_obj
+
+    @param routes_dict: Dictionary with list of instance indices per key e.g. {0: [0,1,2]}
+    @param image_obj: Image object created by create_dataset_dicts
+    @param output_dir: If given, the route images are written to this directory instead of plotted
+    @param scale: Scale of the route images
+    """
+    img_orig = cv2.imread(image_obj["file_name"])
+    renderer = RouteRenderer.from_annotations(img_orig, image_obj)
+    if output_dir is not None:
+        return renderer.write_routes(routes_dict, output_dir, scale)
+    return _plot_route_views(renderer.scaled(scale), routes_dict)
+
+
+def plot_routes_instances(routes_dict, instances, img, output_dir=None, scale=0.25):
     """
     Plots routes based on route_dict and instances object
 
     @param routes_dict: Dictionary with list of instance indices per key e.g. {0: [0,1,2]}
     @param instances: detectron instances object
     @param img: Image in BGR order
+    @param output_dir: If given, the route images are written to this directory instead of plotted
+    @param scale: Scale of the route images
     """
-    figures_axes = []
-    for route_id, holds in routes_dict.items():
-        img_torch = torch.tensor(img).permute(2, 0, 1)
-        final_bitmask = torch.zeros_like(img_torch)
-        for hold_idx in holds:
-            bitmask = instances[hold_idx].pred_masks.cpu().squeeze().int().float()
-            final_bitmask = final_bitmask + bitmask
-        final_bitmask = final_bitmask.bool().float()
-        masked_output = img_torch * final_bitmask
-        img_routes = masked_output.int().permute(1, 2, 0).cpu().detach().numpy()
-        fig, ax = plt.subplots(ncols=2)
-        img_routes = cv2.resize(
-            img_routes, (0, 0), fx=0.25, fy=0.25, interpolation=cv2.INTER_LINEAR_EXACT
-        )
-        img_orig = cv2.resize(
-            img, (0, 0), fx=0.25, fy=0.25, interpolation=cv2.INTER_LINEAR_EXACT
-        )
-        ax[0].imshow(img_routes[:, :, ::-1])
-        ax[0].axis("off")
-        ax[1].imshow(img_orig[:, :, ::-1])
-        ax[1].axis("off")
-        figures_axes.append((fig, ax))
-    return figures_axes
+    renderer = RouteRenderer.from_masks(img, instances.pred_masks.cpu())
+    if output_dir is not None:
+        return renderer.write_routes(routes_dict, output_dir, scale)
+    return _plot_route_views(renderer.scaled(scale), routes_dict)
 
 
 def instance_to_hold(instance, img, transforms, device):
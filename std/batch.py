@@ -0,0 +1,164 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from utils import *
+from tiling import detect_tiled
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def list_images(paths):
+    """Return the images in the paths (walking directories, reading .txt files as lists of paths)."""
+    images = []
+
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in sorted(os.walk(path)):
+                for f in sorted(files):
+                    if f.lower().endswith(IMAGE_EXTENSIONS):
+                        images.append(os.path.join(root, f))
+        elif path.endswith(".txt"):
+            with open(path) as f:
+                images.extend(line.strip() for line in f if line.strip())
+        else:
+            images.append(path)
+
+    return [os.path.normpath(i) for i in images]
+
+
+def output_name(image):
+    """
+    Return the name of the output file of an image: its path flattened, for readability, and a
+    hash of the path, since different paths can flatten to the same name (a/b-c.jpg, a-b/c.jpg).
+    """
+    path = os.path.normpath(image)
+    parts = [p for p in path.split(os.sep) if p not in ("", os.curdir, os.pardir)]
+    digest = hashlib.blake2b(path.encode(), digest_size=4).hexdigest()
+
+    return f"{'-'.join(parts)}-{digest}.npz"
+
+
+def detect(img):
+    """Run the blob -> edge -> detect_holds chain, returning the hold contours."""
+    keypoints = detect_blobs(img)
+    keypoints = merge_blobs(keypoints)
+
+    blur = gaussian_blur(img)
+    edges = canny(blur)
+    contours = ContourSet(find_contours(edges))
+    contours = simplify_contours(contours)
+    contours = filter_contours(contours)
+
+    hold_approximations = detect_holds(img, keypoints, contours)
+
+    return ContourSet(hold_approximations.values())
+
+
+def process(image, output_path, tile_size=None, overlap=128):
+    """
+    Detect the holds of an image and save them, returning the number of holds and the time taken.
+
+    Images larger than the tile size are processed in overlapping tiles (see `detect_tiled`).
+    """
+    start = time.perf_counter()
+
+    img = cv.imread(image)
+    if img is None:
+        raise ValueError(f"Could not read image: {image}")
+
+    if tile_size is not None and max(img.shape[:2]) > tile_size:
+        holds = detect_tiled(detect, img, tile_size, overlap)
+    else:
+        holds = detect(img)
+
+    # write to a temporary file first, so that an interrupted run never leaves a partial output
+    tmp_path = output_path + ".tmp.npz"
+    holds.save(tmp_path)
+    os.replace(tmp_path, output_path)
+
+    return len(holds), time.perf_counter() - start
+
+
+def read_manifest(path):
+    """Return the manifest entries of the images that were processed successfully."""
+    done = {}
+
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                # the last line may be cut short if the previous run was killed while writing it
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+                if "error" not in entry:
+                    done[entry["image"]] = entry
+
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the standard hold detection on a batch of images.")
+    parser.add_argument("inputs", nargs="+", help="images, directories of images or .txt lists of images")
+    parser.add_argument("--output", default="batch", help="the directory of the outputs and the manifest")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="the number of worker processes")
+    parser.add_argument("--tile-size", type=int, default=None, help="process larger images in tiles of this size")
+    parser.add_argument("--overlap", type=int, default=128, help="the overlap between tiles")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    manifest_path = os.path.join(args.output, "manifest.jsonl")
+
+    images = list_images(args.inputs)
+    done = read_manifest(manifest_path)
+    # an image listed twice would be written twice to the same output
+    todo = [i for i in dict.fromkeys(images) if i not in done]
+
+    print(f"{len(images)} images, {len(images) - len(todo)} already done, {len(todo)} to process")
+
+    timings = []
+    failed = 0
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(args.workers) as executor, open(manifest_path, "a") as manifest:
+        futures = {
+            executor.submit(process, image, os.path.join(args.output, output_name(image)), args.tile_size, args.overlap): image
+            for image in todo
+        }
+
+        for future in as_completed(futures):
+            image = futures[future]
+
+            try:
+                holds, seconds = future.result()
+                entry = {"image": image, "output": output_name(image), "holds": holds, "seconds": seconds}
+                timings.append(seconds)
+
+                print(f"{image}: {holds} holds in {seconds:.2f}s")
+            except Exception as e:
+                entry = {"image": image, "error": repr(e)}
+                failed += 1
+
+                print(f"{image}: failed ({e!r})")
+
+            # one line per finished image, flushed so that a killed run can resume from it
+            manifest.write(json.dumps(entry) + "\n")
+            manifest.flush()
+
+    elapsed = time.perf_counter() - start
+
+    print(f"processed {len(timings)} images ({failed} failed) in {elapsed:.1f}s")
+
+    if len(timings) != 0:
+        print(f"throughput: {len(timings) / elapsed * 60:.1f} images/minute")
+        print(f"per image: mean {np.mean(timings):.2f}s, median {np.median(timings):.2f}s, max {np.max(timings):.2f}s")
+
+
+if __name__ == "__main__":
+    main()
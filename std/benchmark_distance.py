@@ -0,0 +1,67 @@
+from utils import *
+
+import time
+
+
+def benchmark(f, repeat=5):
+    """Return the best time of a number of runs of f (in seconds)."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def reference_error(contours_from, contour_to):
+    """The squared_contour_error implementation using point_to_contour_distance."""
+    point_count = 0
+    contour_error = 0
+
+    for c in contours_from:
+        point_count += len(c)
+
+        for pc in contour_to_list(c):
+            contour_error += point_to_contour_distance(pc, contour_to)
+
+    return contour_error / point_count
+
+
+for image in EVALUATION_DATA:
+    img = cv.imread(image)
+    if img is None:
+        print(f"{image}: not found, skipped")
+        continue
+
+    # the same contours that detect_holds compares
+    keypoints = merge_blobs(detect_blobs(img))
+
+    blur = gaussian_blur(img)
+    contours = simplify_contours(find_contours(canny(blur)))
+    contours = filter_straight_contours(filter_size_contours(contours))
+
+    t_contours = simplify_contours(find_contours(canny(threshold(blur, 100, 255)[:,:,0])))
+    t_contours = ContourIndex(t_contours)
+
+    pairs = []
+    for k in keypoints:
+        nearby_contours = get_nearby_contours(k.pt, contours, k.size / 2)
+        closest_t_contour = get_closest_contour(k.pt, t_contours)
+
+        if len(nearby_contours) != 0 and closest_t_contour is not None:
+            pairs.append((nearby_contours, closest_t_contour))
+
+    if len(pairs) == 0:
+        continue
+
+    reference = [reference_error(f, t) for f, t in pairs]
+
+    print(f"{image}: {len(pairs)} contour pairs")
+    print(f"    {'loop':<20} {benchmark(lambda: [reference_error(f, t) for f, t in pairs], 1) * 1000:10.2f} ms")
+
+    for mode in ["segments", "distance_transform"]:
+        errors = [squared_contour_error(f, t, mode) for f, t in pairs]
+        max_difference = max(abs(e - r) for e, r in zip(errors, reference))
+
+        elapsed = benchmark(lambda: [squared_contour_error(f, t, mode) for f, t in pairs])
+        print(f"    {mode:<20} {elapsed * 1000:10.2f} ms (max difference {max_difference:.3f} px)")
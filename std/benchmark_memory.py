@@ -0,0 +1,86 @@
+import sys
+
+from utils import *
+from utils import _best_contour, _planes
+
+import tracemalloc
+
+
+# the documented image term of detect_holds: the blurred image and one thresholded channel with
+# its edges and OpenCV's working copy, i.e. 2x the (3 channel) image
+MEMORY_BOUND = 2
+
+
+def traced_peak(function, *args):
+    """Return the result of a function and the peak of the memory traced while it runs."""
+    tracemalloc.start()
+    try:
+        result = function(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return result, peak
+
+
+def level_search(edges, holds):
+    # the search of one level and channel, as done by _sweep_level once its edges are found
+    t_contours = ContourIndex(simplify_contours.__wrapped__(ContourSet(find_contours.__wrapped__(edges))))
+    candidates = [get_closest_contour(pt, t_contours) for pt, _, _ in holds]
+
+    return _best_contour(holds, candidates, "segments")
+
+
+def contour_bytes(img, keypoints, contours, threshold_step=5):
+    """
+    Return the documented contour term of detect_holds: the ContourIndex of its contours argument,
+    the largest peak of the search of one level and channel (OpenCV's list of contours, the packed
+    and simplified points, their float64 copy and KD-tree in a ContourIndex, and the distance
+    arrays of squared_contour_error), and the largest candidate contour of each hold, which
+    bounds the best contours kept so far.
+    """
+    index, index_bytes = traced_peak(ContourIndex, contours)
+
+    holds = []
+    for k in keypoints:
+        nearby_contours = get_nearby_contours(k.pt, index, (k.size / 2))
+        if len(nearby_contours) != 0:
+            holds.append((k.pt, k.size, nearby_contours))
+
+    search_bytes = 0
+    best_bytes = np.zeros(len(holds))
+    for plane in _planes(gaussian_blur(img)):
+        for i in range(0, 255, threshold_step):
+            # the edges are counted in the image term, so they are computed before tracing
+            edges = canny.__wrapped__(threshold(plane, i, 255))
+            results, peak = traced_peak(level_search, edges, holds)
+
+            search_bytes = max(search_bytes, peak)
+            best_bytes = np.maximum(best_bytes, [0 if c is None else c.nbytes for _, c in results])
+
+    return index_bytes + search_bytes + int(best_bytes.sum())
+
+
+for image in sys.argv[1:] or EVALUATION_DATA:
+    img = cv.imread(image)
+    if img is None:
+        print(f"{image}: not found, skipped")
+        continue
+
+    keypoints = merge_blobs(detect_blobs(img))
+
+    blur = gaussian_blur(img)
+    contours = ContourSet(find_contours(canny(blur)))
+    contours = simplify_contours(contours)
+    contours = filter_contours(contours)
+    del blur
+
+    # numpy (and so OpenCV's Python bindings) allocations are traced, OpenCV's internal buffers aren't
+    hold_approximations, peak = traced_peak(detect_holds.__wrapped__, img, keypoints, contours)
+
+    bound = MEMORY_BOUND * img.nbytes + contour_bytes(img, keypoints, contours)
+
+    print(f"{image}: peak {peak / 2 ** 20:.1f} MiB ({peak / img.nbytes:.2f}x the image), "
+          f"bound {bound / 2 ** 20:.1f} MiB ({bound / img.nbytes:.2f}x the image)")
+
+    assert peak <= bound, "detect_holds exceeded its memory bound"
@@ -0,0 +1,282 @@
+import functools
+import hashlib
+import inspect
+import os
+
+import cv2 as cv
+import numpy as np
+
+try:
+    from .contour_index import ContourIndex
+    from .contour_set import ContourSet
+except ImportError:
+    from contour_index import ContourIndex
+    from contour_set import ContourSet
+
+
+class DiskCache:
+    """
+    Content-addressed cache of pipeline results on disk, one .npz file per result.
+
+    Results are keyed by the stage name and a hash of the stage version and code and of the
+    content of every argument (images, contours, keypoints and parameters, including the
+    defaults), so a result is reused whenever a stage is called again on the same data, whatever
+    produced it. When the files exceed the size cap, the least recently used ones are deleted.
+
+    @param directory: the directory of the cache files
+    @param max_bytes: the size cap of the cache
+    """
+
+    def __init__(self, directory, max_bytes=1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+        os.makedirs(directory, exist_ok=True)
+
+        self.size = sum(os.path.getsize(p) for p in self._files())
+
+        if self.size > self.max_bytes:
+            self._evict()
+
+    def _files(self):
+        return [os.path.join(self.directory, f) for f in os.listdir(self.directory) if f.endswith(".npz")]
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def get(self, key):
+        """Return the cached arrays of a key, or None."""
+        path = self._path(key)
+
+        try:
+            with np.load(path) as data:
+                arrays = dict(data)
+        except (OSError, ValueError):
+            return None
+
+        # the modification time is the last use, for the LRU eviction; the file may have been
+        # evicted by another process in the meantime
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return arrays
+
+    def put(self, key, arrays):
+        """Store the arrays of a key, evicting the least recently used files if over the cap."""
+        path = self._path(key)
+
+        # written to a temporary file first, so that a reader never sees a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, **arrays)
+        size = os.path.getsize(tmp_path)
+
+        # an overwritten file no longer counts
+        try:
+            size -= os.path.getsize(path)
+        except OSError:
+            pass
+
+        os.replace(tmp_path, path)
+
+        self.size += size
+
+        if self.size > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        files = []
+        for p in self._files():
+            try:
+                stat = os.stat(p)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, p))
+
+        self.size = sum(size for _, size, _ in files)
+
+        for _, size, p in sorted(files):
+            if self.size <= self.max_bytes:
+                break
+
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+
+    def clear(self):
+        """Delete every cached result."""
+        for p in self._files():
+            os.remove(p)
+
+        self.size = 0
+
+
+# the active cache, set with set_cache or the STD_CACHE_DIR environment variable
+_cache = DiskCache(os.environ["STD_CACHE_DIR"]) if "STD_CACHE_DIR" in os.environ else None
+
+
+def set_cache(cache):
+    """Set the cache used by the cached pipeline stages (None to disable caching)."""
+    global _cache
+    _cache = cache
+
+
+def _keypoint_array(keypoints):
+    return np.array([(*k.pt, k.size, k.angle, k.response, k.octave, k.class_id) for k in keypoints],
+                    dtype=np.float64).reshape(-1, 7)
+
+
+def _keypoints(array):
+    return [cv.KeyPoint(x, y, size, angle, response, int(octave), int(class_id))
+            for x, y, size, angle, response, octave, class_id in array.tolist()]
+
+
+def _update_hash(h, value):
+    """Feed the content of a value to a hash, raising TypeError if it can't be hashed."""
+    if isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value)
+        h.update(f"array {value.dtype} {value.shape};".encode())
+        h.update(value.data)
+    elif isinstance(value, ContourSet):
+        h.update(b"contours;")
+        _update_hash(h, value.points)
+        _update_hash(h, value.lengths)
+    elif isinstance(value, ContourIndex):
+        _update_hash(h, value.contours)
+    elif isinstance(value, cv.KeyPoint):
+        h.update(b"keypoint;")
+        _update_hash(h, _keypoint_array([value]))
+    elif isinstance(value, (list, tuple)):
+        h.update(f"list {len(value)};".encode())
+        for v in value:
+            _update_hash(h, v)
+    elif value is None or isinstance(value, (bool, int, float, str)):
+        h.update(f"{type(value).__name__} {value!r};".encode())
+    else:
+        raise TypeError(f"Can't hash a {type(value).__name__}")
+
+
+def _encode(value, keys=None):
+    """Return a result as a dict of arrays.
+
+    @param keys: the items keying a dict result (e.g. the keypoints of detect_holds), which is
+    stored by the index of each key, so that it can be rebuilt with the caller's own keys
+    """
+    if isinstance(value, np.ndarray):
+        return {"kind": np.array("array"), "array": value}
+
+    if isinstance(value, ContourSet):
+        return {"kind": np.array("contour_set"), "points": value.points, "lengths": value.lengths}
+
+    if isinstance(value, dict):
+        if keys is None:
+            raise TypeError("Can't cache a dict without the items keying it")
+
+        index = {id(k): i for i, k in enumerate(keys)}
+        contours = ContourSet(value.values())
+        return {"kind": np.array("holds"), "keys": np.array([index[id(k)] for k in value], dtype=np.int64),
+                "points": contours.points, "lengths": contours.lengths}
+
+    if isinstance(value, (list, tuple)):
+        if len(value) != 0 and isinstance(value[0], cv.KeyPoint):
+            return {"kind": np.array("keypoints"), "keypoints": _keypoint_array(value)}
+
+        contours = ContourSet(value)
+        return {"kind": np.array("contours"), "points": contours.points, "lengths": contours.lengths}
+
+    raise TypeError(f"Can't cache a {type(value).__name__}")
+
+
+def _decode(arrays, keys=None):
+    kind = str(arrays["kind"])
+
+    if kind == "array":
+        return arrays["array"]
+
+    if kind == "keypoints":
+        return _keypoints(arrays["keypoints"])
+
+    contours = ContourSet.from_buffer(arrays["points"], arrays["lengths"])
+
+    if kind == "contour_set":
+        return contours
+    if kind == "contours":
+        return [np.array(c) for c in contours]
+    if kind == "holds":
+        return {keys[i]: np.array(c) for i, c in zip(arrays["keys"].tolist(), contours)}
+
+    raise ValueError(f"Unknown cache entry kind: {kind}")
+
+
+def _stage_salt(functions, version):
+    """Return the version salt of a stage: its version and a hash of the source code of the stage
+    and its dependencies."""
+    h = hashlib.blake2b(digest_size=8)
+    for function in functions:
+        try:
+            h.update(inspect.getsource(function).encode())
+        except (OSError, TypeError):
+            h.update(function.__code__.co_code)
+
+    return f"{version} {h.hexdigest()}"
+
+
+def cached(function=None, ignore=("executor",), version=1, depends=(), keyed_by=None):
+    """
+    Decorate a pipeline stage so that its results are stored in the active cache.
+
+    Without an active cache (see set_cache), the stage runs as usual. The key includes a salt of
+    the stage, so that a cache directory doesn't serve stale results after the stage changes: the
+    source of the stage and of its dependencies is hashed, and the version must be bumped when a
+    change elsewhere (e.g. in OpenCV) changes its results.
+
+    @param ignore: the arguments that don't change the result, left out of the key
+    @param version: the version of the stage
+    @param depends: the functions the results of the stage depend on
+    @param keyed_by: the argument whose items key a dict result (stored by index)
+    """
+    if function is None:
+        return functools.partial(cached, ignore=ignore, version=version, depends=depends, keyed_by=keyed_by)
+
+    signature = inspect.signature(function)
+    salt = _stage_salt((function,) + tuple(depends), version)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if _cache is None:
+            return function(*args, **kwargs)
+
+        arguments = signature.bind(*args, **kwargs)
+        arguments.apply_defaults()
+
+        h = hashlib.blake2b(f"{function.__name__} {salt};".encode(), digest_size=20)
+        try:
+            for name, value in arguments.arguments.items():
+                if name not in ignore:
+                    h.update(f"{name}=".encode())
+                    _update_hash(h, value)
+        except TypeError:
+            return function(*args, **kwargs)
+
+        key = f"{function.__name__}-{h.hexdigest()}"
+        keys = None if keyed_by is None else list(arguments.arguments[keyed_by])
+
+        arrays = _cache.get(key)
+        if arrays is not None:
+            return _decode(arrays, keys)
+
+        result = function(*args, **kwargs)
+
+        try:
+            arrays = _encode(result, keys)
+        except TypeError:
+            return result
+
+        _cache.put(key, arrays)
+
+        return result
+
+    return wrapper
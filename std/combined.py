@@ -13,10 +13,9 @@ keypoints = merge_blobs(keypoints)
 # edges
 blur = gaussian_blur(img)
 edges = canny(blur)
-contours = find_contours(edges)
+contours = ContourSet(find_contours(edges))
 contours = simplify_contours(contours)
-contours = filter_size_contours(contours)
-contours = filter_straight_contours(contours)
+contours = filter_contours(contours)
 
 hold_approximations = detect_holds(img, keypoints, contours)
 
@@ -0,0 +1,59 @@
+import numpy as np
+
+from scipy.spatial import cKDTree
+
+try:
+    from .contour_set import ContourSet
+except ImportError:
+    from contour_set import ContourSet
+
+
+class ContourIndex:
+    """
+    KD-tree over the points of a list of contours, for proximity queries that would otherwise
+    have to scan every point of every contour.
+
+    @param contours: a list of OpenCV contours or a ContourSet
+    """
+
+    def __init__(self, contours):
+        if isinstance(contours, ContourSet):
+            self.contours = contours
+            self.points = contours.float_points()
+            lengths = contours.lengths
+        else:
+            self.contours = list(contours)
+            self.points = ContourSet(self.contours).float_points()
+            lengths = [len(c) for c in self.contours]
+
+        # the index of the contour each point belongs to
+        self.point_contours = np.repeat(np.arange(len(self.contours)), lengths)
+
+        self.tree = cKDTree(self.points)
+
+    def __len__(self):
+        return len(self.contours)
+
+    def __iter__(self):
+        return iter(self.contours)
+
+    def nearby(self, point, distance):
+        """Return a list of contours any of whose points are closer to the point than the distance."""
+        if len(self.points) == 0:
+            return []
+
+        idx = np.asarray(self.tree.query_ball_point(point, distance), dtype=np.int64)
+
+        # the ball query includes points exactly at the distance, which are not close enough
+        idx = idx[np.hypot(*(self.points[idx] - point).T) < distance]
+
+        return [self.contours[i] for i in np.unique(self.point_contours[idx])]
+
+    def closest(self, point):
+        """Return the closest contour, given a point (or None if there are no contours)."""
+        if len(self.points) == 0:
+            return None
+
+        _, i = self.tree.query(point)
+
+        return self.contours[self.point_contours[i]]
@@ -0,0 +1,101 @@
+import numpy as np
+
+
+def segment_reduce(ufunc, values, offsets, lengths, initial=0):
+    """Reduce each (offset, length) segment of an array with the given ufunc (empty ones to initial)."""
+    result = np.full((len(lengths),) + values.shape[1:], initial, dtype=values.dtype)
+
+    nonempty = lengths > 0
+    if nonempty.any():
+        result[nonempty] = ufunc.reduceat(values, offsets[nonempty], axis=0)
+
+    return result
+
+
+class ContourSet:
+    """
+    A list of contours stored in a single int32 point buffer with per-contour offsets and lengths.
+
+    Indexing with an integer returns a zero-copy (n, 1, 2) view of the buffer, which OpenCV accepts
+    as a contour; the set itself can be passed to OpenCV as a list of contours (e.g. to
+    cv.drawContours). Indexing with a slice, an index array or a boolean mask returns a new set.
+    The (x1, y1, x2, y2) bounding boxes of the contours are precomputed in `boxes`.
+
+    @param contours: a list of OpenCV contours (or another ContourSet, whose buffers are shared)
+    """
+
+    def __init__(self, contours=()):
+        if isinstance(contours, ContourSet):
+            self.points, self.offsets, self.lengths, self.boxes = \
+                contours.points, contours.offsets, contours.lengths, contours.boxes
+            return
+
+        contours = list(contours)
+
+        lengths = np.array([len(c) for c in contours], dtype=np.int64)
+        points = np.concatenate([np.reshape(c, (-1, 2)) for c in contours] + [np.empty((0, 2))])
+
+        self._set_buffer(points.astype(np.int32).reshape(-1, 1, 2), lengths)
+
+    @classmethod
+    def from_buffer(cls, points, lengths):
+        """Create a set from an (n, 1, 2) int32 point buffer and the lengths of its contours."""
+        contour_set = cls.__new__(cls)
+        contour_set._set_buffer(points, np.asarray(lengths, dtype=np.int64))
+        return contour_set
+
+    def _set_buffer(self, points, lengths):
+        self.points = points
+        self.lengths = lengths
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+
+        xy = points.reshape(-1, 2)
+        self.boxes = np.concatenate([
+            segment_reduce(np.minimum, xy, self.offsets, lengths),
+            segment_reduce(np.maximum, xy, self.offsets, lengths),
+        ], axis=1)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __getitem__(self, i):
+        if isinstance(i, (int, np.integer)):
+            if i < 0:
+                i += len(self)
+            if not 0 <= i < len(self):
+                raise IndexError("contour index out of range")
+
+            return self.points[self.offsets[i]:self.offsets[i] + self.lengths[i]]
+
+        return self.subset(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.points[self.offsets[i]:self.offsets[i] + self.lengths[i]]
+
+    def subset(self, idx):
+        """Return a new set of the contours selected by a slice, an index array or a boolean mask."""
+        idx = np.arange(len(self))[idx]
+
+        lengths = self.lengths[idx]
+        starts = self.offsets[idx]
+
+        # the index of each selected point in the buffer
+        new_offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+        point_idx = np.repeat(starts - new_offsets, lengths) + np.arange(np.sum(lengths))
+
+        return ContourSet.from_buffer(self.points[point_idx], lengths)
+
+    def float_points(self):
+        """Return the points of all contours as an (n, 2) float64 array."""
+        return self.points.reshape(-1, 2).astype(np.float64)
+
+    def save(self, path):
+        """Save the set to an .npz file."""
+        np.savez(path, points=self.points, lengths=self.lengths)
+
+    @classmethod
+    def load(cls, path):
+        """Load a set saved by ContourSet.save."""
+        with np.load(path) as data:
+            return cls.from_buffer(data["points"], data["lengths"])
@@ -0,0 +1,127 @@
+import cv2 as cv
+import numpy as np
+
+try:
+    from .contour_set import ContourSet
+except ImportError:
+    from contour_set import ContourSet
+
+
+def box_polygons(boxes):
+    """Return the (n, 4, 2) int32 corner polygons of (x1, y1, x2, y2) boxes."""
+    x1, y1, x2, y2 = np.asarray(boxes).reshape(-1, 4).T
+    return np.stack([
+        np.stack([x1, y1], axis=1), np.stack([x2, y1], axis=1),
+        np.stack([x2, y2], axis=1), np.stack([x1, y2], axis=1),
+    ], axis=1).astype(np.int32)
+
+
+def circle_polygons(centers, radii, max_error=0.5):
+    """
+    Return the (n, m, 2) int32 polygons approximating circles, so that any number of circles can
+    be drawn by a single cv.polylines call (the number of vertices m is chosen so that the
+    largest circle is within max_error pixels).
+    """
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+    radii = np.asarray(radii, dtype=np.float64).reshape(-1)
+
+    r_max = radii.max(initial=0)
+    if r_max <= max_error:
+        m = 8
+    else:
+        m = int(np.clip(np.ceil(np.pi / np.arccos(1 - max_error / r_max)), 8, 256))
+
+    angles = np.linspace(0, 2 * np.pi, m, endpoint=False)
+    unit = np.stack([np.cos(angles), np.sin(angles)], axis=1)
+
+    return np.round(centers[:, None] + radii[:, None, None] * unit[None]).astype(np.int32)
+
+
+def keypoint_arrays(keypoints):
+    """Return the (n, 2) centers and (n,) radii of a list of cv.KeyPoint."""
+    centers = np.array([k.pt for k in keypoints], dtype=np.float64).reshape(-1, 2)
+    radii = np.array([k.size / 2 for k in keypoints], dtype=np.float64)
+    return centers, radii
+
+
+class Overlay:
+    """
+    A drawing layer over an image, for drawing many primitives at once.
+
+    Each call draws all of its primitives with a single OpenCV call (boxes and circles are
+    converted to polygon arrays for cv.polylines), and the layer is blended with the image only
+    once, in render. With a scale below 1, everything is drawn on a downscaled copy of the image
+    (with scaled coordinates and thickness), which is much cheaper than drawing at full
+    resolution and resizing for a preview.
+
+    @param img: the image
+    @param scale: the scale of the rendered image
+    """
+
+    def __init__(self, img, scale=1.0):
+        self.scale = scale
+
+        if scale == 1:
+            self.base = img
+        else:
+            self.base = cv.resize(img, (0, 0), fx=scale, fy=scale, interpolation=cv.INTER_AREA)
+
+        self.layer = self.base.copy()
+
+    def _thickness(self, thickness):
+        return thickness if thickness < 0 or self.scale == 1 else max(1, int(round(thickness * self.scale)))
+
+    def _scaled(self, points):
+        if self.scale == 1:
+            return points
+        return np.round(np.asarray(points) * self.scale).astype(np.int32)
+
+    def contours(self, contours, color, thickness):
+        """Draw contours (a list of contours or a ContourSet)."""
+        contour_set = ContourSet(contours)
+        if len(contour_set) == 0:
+            return self
+
+        contour_set = ContourSet.from_buffer(self._scaled(contour_set.points), contour_set.lengths)
+        cv.drawContours(self.layer, list(contour_set), -1, color=color, thickness=self._thickness(thickness))
+
+        return self
+
+    def polygons(self, polygons, color, thickness):
+        """Draw closed polygons, given as an (n, m, 2) array or a list of (m, 2) arrays."""
+        if len(polygons) == 0:
+            return self
+
+        polygons = [self._scaled(p).reshape(-1, 1, 2).astype(np.int32) for p in polygons]
+        cv.polylines(self.layer, polygons, True, color=color, thickness=self._thickness(thickness))
+
+        return self
+
+    def boxes(self, boxes, color, thickness):
+        """Draw (x1, y1, x2, y2) boxes, given as an (n, 4) array."""
+        return self.polygons(box_polygons(boxes), color, thickness)
+
+    def circles(self, centers, radii, color, thickness):
+        """Draw circles, given as (n, 2) centers and (n,) radii."""
+        if len(radii) == 0:
+            return self
+
+        centers = np.asarray(centers, dtype=np.float64) * self.scale
+        radii = np.asarray(radii, dtype=np.float64) * self.scale
+
+        polygons = circle_polygons(centers, radii)
+        cv.polylines(self.layer, list(polygons.reshape(len(polygons), -1, 1, 2)), True, color=color,
+                     thickness=self._thickness(thickness))
+
+        return self
+
+    def keypoints(self, keypoints, color, thickness):
+        """Draw the circles of a list of cv.KeyPoint."""
+        return self.circles(*keypoint_arrays(keypoints), color, thickness)
+
+    def render(self, alpha=1.0):
+        """Return the image with the layer blended over it (with the given opacity)."""
+        if alpha == 1:
+            return self.layer.copy()
+
+        return cv.addWeighted(self.base, 1 - alpha, self.layer, alpha, 0)
@@ -1,6 +1,11 @@
 from utils import *
+from drawing import Overlay
+from image_writer import ImageWriter
 
 
+writer = ImageWriter()
+set_image_writer(writer)
+
 for image in EVALUATION_DATA:
     img = cv.imread(image)
     process_image(img, "edges/1-original.jpg")
@@ -11,17 +16,16 @@ for image in EVALUATION_DATA:
     edges = canny(blur)
     process_image(edges, "edges/3-edges.jpg")
 
-    contours = find_contours(edges)
-    contours_img = img.copy()
-    draw_contours(contours_img, contours)
-    process_image(contours_img, "edges/4-contours.jpg")
+    contours = ContourSet(find_contours(edges))
+    overlay = Overlay(img, scale=0.5).contours(contours, STROKE_COLOR, STROKE_THICKNESS)
+    process_image(overlay.render(), "edges/4-contours.jpg", scaling=1)
 
     contours = filter_size_contours(contours)
-    contours_img = img.copy()
-    draw_contours(contours_img, contours)
-    process_image(contours_img, "edges/5-contours-area-filter.jpg")
+    overlay = Overlay(img, scale=0.5).contours(contours, STROKE_COLOR, STROKE_THICKNESS)
+    process_image(overlay.render(), "edges/5-contours-area-filter.jpg", scaling=1)
 
     contours = filter_straight_contours(contours)
-    contours_img = img.copy()
-    draw_contours(contours_img, contours)
-    process_image(contours_img, "edges/6-contours-straight-filter.jpg")
+    overlay = Overlay(img, scale=0.5).contours(contours, STROKE_COLOR, STROKE_THICKNESS)
+    process_image(overlay.render(), "edges/6-contours-straight-filter.jpg", scaling=1)
+
+writer.close()
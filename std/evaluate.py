@@ -15,15 +15,14 @@ for file in EVALUATION_DATA[:1]:
     # edges
     blur = gaussian_blur(img)
     edges = canny(blur)
-    contours = find_contours(edges)
+    contours = ContourSet(find_contours(edges))
     contours = simplify_contours(contours)
-    contours = filter_size_contours(contours)
-    contours = filter_straight_contours(contours)
+    contours = filter_contours(contours)
 
     # holds
     hold_approximations = detect_holds(img, keypoints, contours)
 
-    instances.append(to_detectron_format(img, list(hold_approximations.values())))
+    instances.append(to_detectron_format(img, list(hold_approximations.values()), mask_format="cropped"))
 
 for instance in instances:
     print(instances_to_coco_json(instance))
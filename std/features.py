@@ -0,0 +1,179 @@
+import cv2 as cv
+import numpy as np
+
+
+class MomentAccumulator:
+    """
+    Streaming per-region colour moments, from counts and power sums (1st to 4th) of the values.
+
+    Values can be added in any number of chunks (e.g. tiles, or the pixels of several images). To
+    keep the power sums well conditioned, each region's values are shifted by the first value
+    seen in that region, which doesn't change the central moments.
+
+    @param n: the number of regions
+    @param channels: the number of channels of the values
+    """
+
+    def __init__(self, n, channels):
+        self.count = np.zeros(n, dtype=np.int64)
+        self.power_sums = np.zeros((4, n, channels))
+        self.reference = np.full((n, channels), np.nan)
+
+    def add(self, labels, values):
+        """Add the (pixels, channels) values of the pixels of the given regions."""
+        values = np.asarray(values, dtype=np.float64).reshape(len(labels), -1)
+        n = len(self.count)
+
+        # the first value of each region not seen before becomes its reference
+        regions, first = np.unique(labels, return_index=True)
+        unset = np.isnan(self.reference[regions, 0])
+        self.reference[regions[unset]] = values[first[unset]]
+
+        d = values - self.reference[labels]
+        p = np.ones_like(d)
+        for k in range(4):
+            p *= d
+            for c in range(d.shape[1]):
+                self.power_sums[k, :, c] += np.bincount(labels, weights=p[:, c], minlength=n)
+
+        self.count += np.bincount(labels, minlength=n)
+
+    def _central_moments(self):
+        n = np.maximum(self.count, 1)[:, None]
+        s1, s2, s3, s4 = self.power_sums / n
+
+        m2 = s2 - s1 ** 2
+        m3 = s3 - 3 * s1 * s2 + 2 * s1 ** 3
+        m4 = s4 - 4 * s1 * s3 + 6 * s1 ** 2 * s2 - 3 * s1 ** 4
+
+        return s1, np.maximum(m2, 0), m3, m4
+
+    def mean(self):
+        """Return the (regions, channels) means (0 for empty regions)."""
+        s1, _, _, _ = self._central_moments()
+        return np.where(self.count[:, None] > 0, np.nan_to_num(self.reference) + s1, 0)
+
+    def std(self):
+        """Return the (regions, channels) standard deviations (like cv.meanStdDev)."""
+        _, m2, _, _ = self._central_moments()
+        return np.sqrt(m2)
+
+    def skewness(self):
+        """Return the (regions, channels) skewness (like scipy.stats.skew, nan for constant regions)."""
+        _, m2, m3, _ = self._central_moments()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(m2 > 0, m3 / m2 ** 1.5, np.nan)
+
+    def kurtosis(self):
+        """Return the (regions, channels) excess kurtosis (like scipy.stats.kurtosis, nan for
+        constant regions)."""
+        _, m2, _, m4 = self._central_moments()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(m2 > 0, m4 / m2 ** 2 - 3, np.nan)
+
+
+class RegionPixels:
+    """
+    The pixels of a set of polygonal regions (e.g. hold annotations), for computing per-region
+    statistics of images in a single pass over the pixels with np.bincount.
+
+    Each polygon is rasterised once, within its bounding box only; the flat indices of the pixels
+    inside each region and their region labels are concatenated, so the statistics of all
+    regions of an image are reductions over one gathered array. Unlike a single label image,
+    pixels shared by overlapping regions count for each of them.
+
+    @param shape: the (height, width) of the images
+    @param polygons: a list of (n, 2) polygon point arrays
+    """
+
+    def __init__(self, shape, polygons):
+        h, w = shape[:2]
+        self.shape = (h, w)
+        self.n = len(polygons)
+
+        pixels, labels = [], []
+        for label, points in enumerate(polygons):
+            points = np.reshape(points, (-1, 2)).astype(np.int32)
+
+            x1, y1 = np.maximum(points.min(axis=0), 0).tolist()
+            x2, y2 = np.minimum(points.max(axis=0), (w - 1, h - 1)).tolist()
+            if x1 > x2 or y1 > y2:
+                continue
+
+            crop = np.zeros((y2 - y1 + 1, x2 - x1 + 1), dtype=np.uint8)
+            cv.fillPoly(crop, [points], 1, offset=(-x1, -y1))
+
+            ys, xs = np.nonzero(crop)
+            pixels.append((ys + y1) * w + xs + x1)
+            labels.append(np.full(len(ys), label, dtype=np.int64))
+
+        self.pixels = np.concatenate(pixels + [np.empty(0, dtype=np.int64)])
+        self.labels = np.concatenate(labels + [np.empty(0, dtype=np.int64)])
+
+        self.counts = np.bincount(self.labels, minlength=self.n)
+
+    def values(self, image, color_space=None):
+        """
+        Return the (pixels, channels) values of the region pixels of an image, as float64.
+
+        @param color_space: a cv.cvtColor conversion code (e.g. cv.COLOR_BGR2LAB), applied to the
+        region pixels only
+        """
+        channels = image.shape[2] if image.ndim == 3 else 1
+        values = image.reshape(-1, channels)[self.pixels]
+
+        if color_space is not None and len(values) != 0:
+            values = cv.cvtColor(values.reshape(1, -1, channels), color_space)
+            values = values.reshape(len(self.pixels), -1)
+
+        return values.astype(np.float64)
+
+    def sums(self, values):
+        """Return the (regions, channels) sums of the values of each region."""
+        return np.stack([
+            np.bincount(self.labels, weights=v, minlength=self.n) for v in values.T
+        ], axis=1)
+
+    def mean_std(self, image):
+        """Return the (regions, channels) means and standard deviations (like cv.meanStdDev)."""
+        moments = self.moments(image)
+        return moments.mean(), moments.std()
+
+    def moments(self, image, color_space=None):
+        """Return the MomentAccumulator of the regions of an image (in the given color space)."""
+        values = self.values(image, color_space)
+
+        accumulator = MomentAccumulator(self.n, values.shape[1])
+        accumulator.add(self.labels, values)
+
+        return accumulator
+
+    def histograms(self, image, channel=0, bins=256, value_range=(0, 256)):
+        """Return the (regions, bins) histograms of a channel (like cv.calcHist)."""
+        values = self.values(image)[:, channel]
+
+        lo, hi = value_range
+        idx = np.floor((values - lo) * bins / (hi - lo)).astype(np.int64)
+        inside = (idx >= 0) & (idx < bins)
+
+        flat = np.bincount(self.labels[inside] * bins + idx[inside], minlength=self.n * bins)
+
+        return flat.reshape(self.n, bins).astype(np.float32)
+
+
+def annotation_regions(shape, d_dict, skip_category=1):
+    """
+    Return the RegionPixels of the annotated holds of a dataset dict and their annotation indices.
+
+    @param skip_category: the annotations of this category are skipped (volumes are considered
+    part of the wall, not part of a route)
+    """
+    indices, polygons = [], []
+    for idx, poly in enumerate(d_dict["annotations"]):
+        if poly["category_id"] == skip_category:
+            continue
+
+        indices.append(idx)
+        polygons.append(np.array(poly["segmentation"]).reshape((-1, 2)))
+
+    return RegionPixels(shape, polygons), indices
@@ -0,0 +1,118 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import cv2 as cv
+
+
+class ImageWriter:
+    """
+    Writes images in the background, so that encoding doesn't stall the pipeline.
+
+    Images are resized on the calling thread (or copied, since the caller may keep drawing on
+    them) and encoded and written by a thread pool; OpenCV releases the GIL while encoding. At
+    most max_pending images are queued: write blocks while the queue is full, which bounds the
+    memory of the pending images. Writes to the same file are done in the order they were queued,
+    so a file is never written by two threads at once. Errors are raised by the next flush or
+    close.
+
+    @param max_workers: the number of writer threads
+    @param max_pending: the maximum number of queued images
+    @param extension: the format to write (e.g. ".png"), replacing the extension of the file
+    names (None to keep it)
+    @param quality: the JPEG or WebP quality (0-100), or the PNG compression level (0-9)
+    @param scale: the default scale of the written images
+    """
+
+    def __init__(self, max_workers=2, max_pending=8, extension=None, quality=None, scale=1.0):
+        self.extension = extension
+        self.quality = quality
+        self.scale = scale
+
+        self._executor = ThreadPoolExecutor(max_workers)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._futures = set()
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def _params(self, filename):
+        if self.quality is None:
+            return []
+
+        ext = os.path.splitext(filename)[1].lower()
+        if ext in (".jpg", ".jpeg"):
+            return [cv.IMWRITE_JPEG_QUALITY, self.quality]
+        if ext == ".webp":
+            return [cv.IMWRITE_WEBP_QUALITY, self.quality]
+        if ext == ".png":
+            return [cv.IMWRITE_PNG_COMPRESSION, self.quality]
+
+        return []
+
+    def _write(self, filename, img, previous):
+        try:
+            # the previous write of the file was submitted first, so it is running or done
+            if previous is not None:
+                wait([previous])
+
+            d = os.path.dirname(filename)
+            if d != "":
+                os.makedirs(d, exist_ok=True)
+
+            if not cv.imwrite(filename, img, self._params(filename)):
+                raise IOError(f"Could not write image: {filename}")
+        finally:
+            self._slots.release()
+
+    def write(self, filename, img, scale=None):
+        """Queue an image to be written, blocking while max_pending images are queued."""
+        scale = self.scale if scale is None else scale
+
+        if self.extension is not None:
+            filename = os.path.splitext(filename)[0] + self.extension
+
+        if scale != 1:
+            h, w = img.shape[:2]
+            img = cv.resize(img, (int(w * scale), int(h * scale)), interpolation=cv.INTER_LINEAR)
+        else:
+            img = img.copy()
+
+        self._slots.acquire()
+
+        with self._lock:
+            try:
+                future = self._executor.submit(self._write, filename, img, self._last.get(filename))
+            except BaseException:
+                self._slots.release()
+                raise
+
+            self._futures.add(future)
+            self._last[filename] = future
+
+        future.add_done_callback(lambda f: self._done(filename, f))
+
+    def _done(self, filename, future):
+        with self._lock:
+            if self._last.get(filename) is future:
+                del self._last[filename]
+
+    def flush(self):
+        """Wait until every queued image is written (raising the first error, if any)."""
+        with self._lock:
+            futures, self._futures = self._futures, set()
+
+        for future in futures:
+            future.result()
+
+    def close(self):
+        """Write the queued images and stop the threads."""
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
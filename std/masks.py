@@ -0,0 +1,77 @@
+import cv2 as cv
+import numpy as np
+
+
+class CroppedMasks:
+    """
+    Instance masks stored as bitmasks cropped to the bounding box of each instance.
+
+    The masks of n instances take the area of their boxes instead of n full images. A dense
+    (height, width) mask is only materialised when it is requested: indexing with an integer or
+    iterating returns them one at a time, and `dense` (or np.asarray) returns all of them.
+    Indexing with a slice, an index array or a boolean mask returns a new CroppedMasks, so the
+    masks can be stored in (and indexed through) detectron2 Instances.
+
+    @param crops: the boolean mask of each instance, cropped to its box
+    @param boxes: the (x1, y1, x2, y2) box of each instance (inclusive)
+    @param image_size: the (height, width) of the image
+    """
+
+    def __init__(self, crops, boxes, image_size):
+        self.crops = list(crops)
+        self.boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+        self.image_size = tuple(image_size)
+
+    @classmethod
+    def from_contours(cls, contours, boxes, image_size):
+        """Rasterise the filled contours within their boxes."""
+        crops = []
+        for c, (x1, y1, x2, y2) in zip(contours, np.asarray(boxes).tolist()):
+            crop = np.zeros((y2 - y1 + 1, x2 - x1 + 1), dtype=np.uint8)
+            cv.drawContours(crop, [c], -1, 1, cv.FILLED, offset=(-x1, -y1))
+            crops.append(crop.astype(bool))
+
+        return cls(crops, boxes, image_size)
+
+    def __len__(self):
+        return len(self.crops)
+
+    def __getitem__(self, i):
+        if isinstance(i, (int, np.integer)):
+            return self._dense(self.crops[i], self.boxes[i])
+
+        idx = np.arange(len(self))[i]
+        return CroppedMasks([self.crops[j] for j in idx.tolist()], self.boxes[idx], self.image_size)
+
+    def __iter__(self):
+        for crop, box in zip(self.crops, self.boxes):
+            yield self._dense(crop, box)
+
+    def __array__(self, dtype=None, copy=None):
+        dense = self.dense()
+        return dense if dtype is None else dense.astype(dtype)
+
+    def _dense(self, crop, box):
+        x1, y1, x2, y2 = box.tolist()
+
+        mask = np.zeros(self.image_size, dtype=bool)
+        mask[y1:y2 + 1, x1:x2 + 1] = crop
+
+        return mask
+
+    def dense(self):
+        """Return the (n, height, width) boolean array of all masks."""
+        masks = np.zeros((len(self),) + self.image_size, dtype=bool)
+        for m, (crop, box) in zip(masks, zip(self.crops, self.boxes)):
+            x1, y1, x2, y2 = box.tolist()
+            m[y1:y2 + 1, x1:x2 + 1] = crop
+
+        return masks
+
+    def area(self):
+        """Return the number of pixels of each mask."""
+        return np.array([np.count_nonzero(c) for c in self.crops], dtype=np.int64)
+
+    def nbytes(self):
+        """Return the memory used by the crops."""
+        return sum(c.nbytes for c in self.crops)
@@ -0,0 +1,152 @@
+import os
+
+import numpy as np
+
+
+class RouteClusters:
+    """
+    Mini-batch k-means over hold features (e.g. get_color_moments), updated incrementally.
+
+    Each call to partial_fit moves every centroid towards the mean of the holds assigned to it,
+    with a learning rate of one over the number of holds it has seen, which is the mini-batch
+    k-means update; the state is the centroids and their counts, so it can be saved and new
+    photos assigned to the routes without refitting.
+
+    @param n_routes: the number of clusters (routes)
+    @param decay: the factor applied to the counts before each update; below 1, older photos are
+    gradually forgotten, so the centroids follow routes that are reset
+    @param seed: the seed of the k-means++ initialisation
+    """
+
+    def __init__(self, n_routes, decay=1.0, seed=0):
+        self.n_routes = n_routes
+        self.decay = decay
+        self.seed = seed
+
+        self.centroids = None
+        self.counts = np.zeros(n_routes)
+
+    def _init_centroids(self, features):
+        """k-means++ initialisation on the first batch."""
+        rng = np.random.default_rng(self.seed)
+
+        centroids = [features[rng.integers(len(features))]]
+        for _ in range(1, self.n_routes):
+            d = np.min(((features[:, None] - np.array(centroids)[None]) ** 2).sum(axis=2), axis=1)
+            p = d / d.sum() if d.sum() > 0 else None
+            centroids.append(features[rng.choice(len(features), p=p)])
+
+        self.centroids = np.array(centroids, dtype=np.float64)
+
+    def partial_fit(self, features):
+        """Update the centroids with the features of a batch of holds (one row per hold)."""
+        features = np.asarray(features, dtype=np.float64)
+
+        if self.centroids is None:
+            if len(features) < self.n_routes:
+                raise ValueError(f"The first batch needs at least {self.n_routes} holds, got {len(features)}")
+            self._init_centroids(features)
+
+        labels = self.predict(features)
+
+        batch_counts = np.bincount(labels, minlength=self.n_routes)
+        batch_sums = np.zeros_like(self.centroids)
+        np.add.at(batch_sums, labels, features)
+
+        self.counts = self.counts * self.decay + batch_counts
+
+        # equivalent to the per-hold updates c += (x - c) / count, applied for the whole batch
+        updated = batch_counts > 0
+        self.centroids[updated] += (
+            batch_sums[updated] - batch_counts[updated, None] * self.centroids[updated]
+        ) / self.counts[updated, None]
+
+        return self
+
+    def predict(self, features):
+        """Return the route (closest centroid) of each hold."""
+        features = np.asarray(features, dtype=np.float64)
+
+        d = (features ** 2).sum(axis=1)[:, None] - 2 * features @ self.centroids.T + (self.centroids ** 2).sum(axis=1)[None]
+
+        return np.argmin(d, axis=1)
+
+    def routes(self, features, indices=None):
+        """
+        Return the {route_id: [hold_idx]} dictionary of the holds.
+
+        @param indices: the hold index of each feature row (e.g. the annotation indices returned by
+        get_color_moments, which skips volumes, as expected by plot_routes); by default the rows
+        """
+        labels = self.predict(features).tolist()
+        indices = range(len(labels)) if indices is None else list(indices)
+
+        if len(indices) != len(labels):
+            raise ValueError(f"Got {len(indices)} indices for {len(labels)} holds")
+
+        routes = {}
+        for idx, label in zip(indices, labels):
+            routes.setdefault(label, []).append(idx)
+
+        return dict(sorted(routes.items()))
+
+    def save(self, path):
+        """Save the state to an .npz file."""
+        np.savez(path, centroids=self.centroids, counts=self.counts, decay=self.decay, seed=self.seed)
+
+    @classmethod
+    def load(cls, path):
+        """Load a state saved by RouteClusters.save."""
+        with np.load(path) as data:
+            clusters = cls(len(data["centroids"]), float(data["decay"]), int(data["seed"]))
+            clusters.centroids = data["centroids"]
+            clusters.counts = data["counts"]
+
+        return clusters
+
+
+class RouteClusterStore:
+    """
+    The route clusters of each wall, persisted in a directory (one .npz file per wall).
+
+    @param directory: the directory of the cluster states
+    @param n_routes: the number of routes of a new wall
+    @param decay: see RouteClusters
+    """
+
+    def __init__(self, directory, n_routes=7, decay=1.0):
+        self.directory = directory
+        self.n_routes = n_routes
+        self.decay = decay
+
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, wall):
+        return os.path.join(self.directory, f"{wall}.npz")
+
+    def get(self, wall):
+        """Return the clusters of a wall (None if the wall has no clusters yet)."""
+        path = self._path(wall)
+
+        return RouteClusters.load(path) if os.path.exists(path) else None
+
+    def update(self, wall, features, indices=None):
+        """Update the clusters of a wall with the holds of a new photo and return its routes (see
+        RouteClusters.routes for the indices)."""
+        clusters = self.get(wall)
+        if clusters is None:
+            clusters = RouteClusters(self.n_routes, self.decay)
+
+        clusters.partial_fit(features)
+        clusters.save(self._path(wall))
+
+        return clusters.routes(features, indices)
+
+    def assign(self, wall, features, indices=None):
+        """Return the routes of the holds of a photo of a wall, without updating its clusters (see
+        RouteClusters.routes for the indices)."""
+        clusters = self.get(wall)
+        if clusters is None:
+            raise KeyError(f"No route clusters for wall: {wall}")
+
+        return clusters.routes(features, indices)
@@ -0,0 +1,181 @@
+import os
+
+import cv2 as cv
+import numpy as np
+
+try:
+    from .masks import CroppedMasks
+except ImportError:
+    from masks import CroppedMasks
+
+
+def _polygon_parts(points):
+    """Return the (n, 2) int32 parts of a polygon, given as a flat [x1, y1, ...] list, an (n, 2)
+    array or a list of such parts (as in COCO segmentations)."""
+    if len(points) != 0 and np.ndim(points[0]) != 0:
+        return [np.reshape(p, (-1, 2)).astype(np.int32) for p in points]
+
+    return [np.reshape(points, (-1, 2)).astype(np.int32)]
+
+
+class RouteRenderer:
+    """
+    Renders views of the routes of a wall from the masks of its holds.
+
+    Each hold is kept as a bitmask cropped to its bounding box (see CroppedMasks); the view of a
+    route is the union of the masks of its holds, ORed into a single mask, so each route costs the
+    area of the boxes of its holds and one pass over the image, instead of one full-frame mask per
+    hold. Overlapping holds (e.g. a hold on a volume) each keep all of their pixels.
+
+    @param image: the BGR image of the wall
+    @param masks: the CroppedMasks of the holds
+    """
+
+    def __init__(self, image, masks):
+        self.image = image
+        self.masks = masks
+        self.n_holds = len(masks)
+
+    @classmethod
+    def from_polygons(cls, image, polygons):
+        """Create a renderer from the polygons of the holds (flat [x1, y1, ...] lists, (n, 2) arrays
+        or lists of them)."""
+        h, w = image.shape[:2]
+
+        crops, boxes = [], []
+        for points in polygons:
+            parts = _polygon_parts(points)
+
+            # clip the box to the image; a polygon outside of it gets an empty mask
+            x, y, bw, bh = cv.boundingRect(np.concatenate(parts))
+            x1, y1, x2, y2 = max(x, 0), max(y, 0), min(x + bw, w) - 1, min(y + bh, h) - 1
+
+            if x2 < x1 or y2 < y1:
+                crops.append(np.zeros((0, 0), dtype=bool))
+                boxes.append((0, 0, -1, -1))
+                continue
+
+            crop = np.zeros((y2 - y1 + 1, x2 - x1 + 1), dtype=np.uint8)
+            cv.fillPoly(crop, parts, 1, offset=(-x1, -y1))
+
+            crops.append(crop.astype(bool))
+            boxes.append((x1, y1, x2, y2))
+
+        return cls(image, CroppedMasks(crops, boxes, (h, w)))
+
+    @classmethod
+    def from_annotations(cls, image, d_dict):
+        """Create a renderer from the annotations of a dataset dict (hold i is annotation i)."""
+        return cls.from_polygons(image, [a["segmentation"] for a in d_dict["annotations"]])
+
+    @classmethod
+    def from_masks(cls, image, masks):
+        """Create a renderer from the (height, width) masks of the holds (e.g. Instances.pred_masks)."""
+        h, w = image.shape[:2]
+
+        crops, boxes = [], []
+        for mask in masks:
+            mask = np.asarray(mask, dtype=bool).reshape(h, w)
+
+            ys, xs = np.flatnonzero(mask.any(axis=1)), np.flatnonzero(mask.any(axis=0))
+            if len(ys) == 0:
+                crops.append(np.zeros((0, 0), dtype=bool))
+                boxes.append((0, 0, -1, -1))
+                continue
+
+            x1, y1, x2, y2 = xs[0], ys[0], xs[-1], ys[-1]
+            crops.append(mask[y1:y2 + 1, x1:x2 + 1].copy())
+            boxes.append((x1, y1, x2, y2))
+
+        return cls(image, CroppedMasks(crops, boxes, (h, w)))
+
+    def scaled(self, scale):
+        """Return a renderer of the image and hold masks resized by the scale."""
+        if scale == 1:
+            return self
+
+        image = cv.resize(self.image, (0, 0), fx=scale, fy=scale, interpolation=cv.INTER_AREA)
+        h, w = image.shape[:2]
+
+        crops, boxes = [], []
+        for crop, (x1, y1, x2, y2) in zip(self.masks.crops, self.masks.boxes.tolist()):
+            # the scaled box covers the pixels whose centres fall in the original box
+            sx1, sy1 = min(int(round(x1 * scale)), w), min(int(round(y1 * scale)), h)
+            sx2, sy2 = min(int(round((x2 + 1) * scale)), w) - 1, min(int(round((y2 + 1) * scale)), h) - 1
+
+            if crop.size == 0 or sx2 < sx1 or sy2 < sy1:
+                crops.append(np.zeros((0, 0), dtype=bool))
+                boxes.append((0, 0, -1, -1))
+                continue
+
+            crop = cv.resize(crop.astype(np.uint8), (sx2 - sx1 + 1, sy2 - sy1 + 1), interpolation=cv.INTER_NEAREST)
+            crops.append(crop.astype(bool))
+            boxes.append((sx1, sy1, sx2, sy2))
+
+        return RouteRenderer(image, CroppedMasks(crops, boxes, (h, w)))
+
+    def route_mask(self, holds):
+        """Return the boolean mask of the holds of a route (the union of their masks)."""
+        mask = np.zeros(self.masks.image_size, dtype=bool)
+
+        for i in holds:
+            x1, y1, x2, y2 = self.masks.boxes[i].tolist()
+            mask[y1:y2 + 1, x1:x2 + 1] |= self.masks.crops[i]
+
+        return mask
+
+    def render(self, holds):
+        """Return the image with everything but the holds of the route blacked out."""
+        mask = self.route_mask(holds)
+
+        return np.where(mask[:, :, None], self.image, 0).astype(self.image.dtype)
+
+    def render_routes(self, routes):
+        """Yield the (route_id, image) view of each route of a {route_id: [hold_idx]} dictionary."""
+        for route_id, holds in routes.items():
+            yield route_id, self.render(holds)
+
+    def write_routes(self, routes, directory, scale=1.0, prefix="route", extension=".jpg"):
+        """
+        Write the view of each route to {directory}/{prefix}-{route_id}{extension}, without
+        matplotlib, and return the paths.
+
+        @param scale: the scale of the written images (the image and hold masks are resized once)
+        """
+        os.makedirs(directory, exist_ok=True)
+
+        renderer = self.scaled(scale)
+
+        paths = []
+        for route_id, view in renderer.render_routes(routes):
+            path = os.path.join(directory, f"{prefix}-{route_id}{extension}")
+            cv.imwrite(path, view)
+            paths.append(path)
+
+        return paths
+
+
+if __name__ == "__main__":
+    # polygons fully and partly outside of the frame
+    image = np.full((40, 60, 3), 255, dtype=np.uint8)
+    polygons = [
+        [-30, 5, -10, 5, -10, 15, -30, 15],   # left of the frame
+        [10, -30, 20, -30, 20, -10, 10, -10], # above the frame
+        [70, 50, 80, 50, 80, 60, 70, 60],     # right of and below the frame
+        [-5, -5, 10, -5, 10, 10, -5, 10],     # across the top-left corner
+        [50, 30, 65, 30, 65, 45, 50, 45],     # across the bottom-right corner
+    ]
+
+    renderer = RouteRenderer.from_polygons(image, polygons)
+    assert renderer.masks.boxes[:3].tolist() == [[0, 0, -1, -1]] * 3
+    assert renderer.masks.boxes[3:].tolist() == [[0, 0, 10, 10], [50, 30, 59, 39]]
+
+    dense = np.stack(list(renderer.masks))
+    assert not dense[:3].any() and np.array_equal(dense, renderer.masks.dense())
+    assert np.array_equal(renderer.route_mask(range(5)), dense.any(axis=0))
+    assert renderer.render(range(3)).sum() == 0
+
+    for route_id, view in renderer.scaled(0.5).render_routes({0: [0, 1, 2], 1: [3, 4]}):
+        assert view.shape == (20, 30, 3)
+
+    print("ok")
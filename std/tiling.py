@@ -0,0 +1,157 @@
+from collections import deque
+
+import cv2 as cv
+import numpy as np
+
+try:
+    from .contour_set import ContourSet
+except ImportError:
+    from contour_set import ContourSet
+
+
+def tile_boxes(shape, tile_size, overlap):
+    """
+    Return the (x1, y1, x2, y2) boxes (exclusive upper bounds) of overlapping tiles covering an image.
+
+    Consecutive tiles overlap by at least `overlap` pixels; the last tile of each row and column is
+    aligned with the image border.
+    """
+    if not 0 <= overlap < tile_size:
+        raise ValueError(f"Overlap must be in [0, tile_size): {overlap}")
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        s = list(range(0, length - tile_size, tile_size - overlap))
+        return s + [length - tile_size]
+
+    h, w = shape[:2]
+    return [
+        (x, y, min(x + tile_size, w), min(y + tile_size, h))
+        for y in starts(h) for x in starts(w)
+    ]
+
+
+def _inner_margins(boxes, tile, shape):
+    """Return the distance of each (inclusive) box to the tile edges that are not image borders."""
+    h, w = shape[:2]
+    x1, y1, x2, y2 = tile
+
+    margins = np.full(len(boxes), np.inf)
+    for edge, distance in (
+        (x1 > 0, boxes[:, 0] - x1),
+        (y1 > 0, boxes[:, 1] - y1),
+        (x2 < w, x2 - 1 - boxes[:, 2]),
+        (y2 < h, y2 - 1 - boxes[:, 3]),
+    ):
+        if edge:
+            margins = np.minimum(margins, distance)
+
+    return margins
+
+
+def _mask_ios(a, b, box):
+    """Return the intersection over the smaller area of two filled contours within a box."""
+    x1, y1, x2, y2 = box
+    mask_a = np.zeros((y2 - y1 + 1, x2 - x1 + 1), dtype=np.uint8)
+    mask_b = np.zeros_like(mask_a)
+
+    cv.drawContours(mask_a, [a], -1, 1, cv.FILLED, offset=(-x1, -y1))
+    cv.drawContours(mask_b, [b], -1, 1, cv.FILLED, offset=(-x1, -y1))
+
+    smaller = min(np.count_nonzero(mask_a), np.count_nonzero(mask_b))
+    if smaller == 0:
+        return 0.0
+
+    return np.count_nonzero(mask_a & mask_b) / smaller
+
+
+def contour_nms(contours, scores, tiles, threshold=0.5):
+    """
+    Return the indices of the contours kept by non-maximum suppression across tiles.
+
+    Only contours from different tiles suppress each other (detections within a tile are already
+    distinct). The overlap is measured as the intersection over the smaller mask, so that a hold cut
+    by a seam is suppressed by its whole copy from the neighbouring tile.
+
+    @param contours: a ContourSet in image coordinates
+    @param scores: the score of each contour (higher is kept first)
+    @param tiles: the index of the tile each contour comes from
+    @param threshold: the intersection over smaller area above which a contour is suppressed
+    """
+    boxes = contours.boxes
+    order = np.argsort(-np.asarray(scores), kind="stable")
+
+    keep = []
+    for i in order.tolist():
+        if len(keep) != 0:
+            k = np.array(keep)
+            k = k[tiles[k] != tiles[i]]
+
+            # only contours whose boxes intersect can overlap
+            lo = np.maximum(boxes[k, :2], boxes[i, :2])
+            hi = np.minimum(boxes[k, 2:], boxes[i, 2:])
+            k = k[np.all(lo <= hi, axis=1)]
+
+            union = np.concatenate([np.minimum(boxes[k, :2], boxes[i, :2]), np.maximum(boxes[k, 2:], boxes[i, 2:])], axis=1)
+            if any(_mask_ios(contours[i], contours[j], b) > threshold for j, b in zip(k.tolist(), union.tolist())):
+                continue
+
+        keep.append(i)
+
+    return np.sort(np.array(keep, dtype=np.int64))
+
+
+def detect_tiled(detect, img, tile_size=1024, overlap=128, threshold=0.5, executor=None, max_pending=4):
+    """
+    Run a contour detection on overlapping tiles of a large image and merge the results.
+
+    The detection only ever sees a tile, so the memory of its intermediate results is bounded by the
+    tile size instead of the image size. Contours from different tiles are merged with
+    `contour_nms`, preferring the copy furthest from the seams; the overlap should be larger than
+    the largest object, so that each object is whole in at least one tile.
+
+    @param detect: a function from an image (tile) to a list of contours or a ContourSet (picklable
+    if the executor is a process pool)
+    @param img: the image
+    @param tile_size: the width and height of the tiles
+    @param overlap: the minimum overlap between neighbouring tiles
+    @param threshold: the NMS threshold (see `contour_nms`)
+    @param executor: a concurrent.futures executor to run the tiles in parallel (None to run them
+    sequentially)
+    @param max_pending: the maximum number of tiles submitted to the executor at once, which
+    bounds the memory of the copies sent to the workers
+    """
+    tiles = tile_boxes(img.shape, tile_size, overlap)
+
+    def results():
+        if executor is None:
+            for x1, y1, x2, y2 in tiles:
+                yield detect(img[y1:y2, x1:x2])
+            return
+
+        pending = deque()
+        for x1, y1, x2, y2 in tiles:
+            if len(pending) == max_pending:
+                yield pending.popleft().result()
+            pending.append(executor.submit(detect, np.ascontiguousarray(img[y1:y2, x1:x2])))
+
+        while pending:
+            yield pending.popleft().result()
+
+    points, lengths, scores, tile_idx = [], [], [], []
+    for t, (tile, contours) in enumerate(zip(tiles, results())):
+        contours = ContourSet(contours)
+
+        points.append(contours.points + np.array(tile[:2], dtype=np.int32))
+        lengths.append(contours.lengths)
+        scores.append(_inner_margins(contours.boxes + np.tile(tile[:2], 2), tile, img.shape))
+        tile_idx.append(np.full(len(contours), t))
+
+    if len(points) == 0:
+        return ContourSet()
+
+    merged = ContourSet.from_buffer(np.concatenate(points), np.concatenate(lengths))
+    keep = contour_nms(merged, np.concatenate(scores), np.concatenate(tile_idx), threshold)
+
+    return merged.subset(keep)
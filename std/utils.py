@@ -1,21 +1,45 @@
 import os
+import time
 import cv2 as cv
 import numpy as np
 from typing import List
 import matplotlib.pyplot as plt
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from multiprocessing import shared_memory
 
-from scipy.stats import linregress
-from shapely.geometry import Polygon
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
 
-from detectron2.structures import Instances, Boxes
+from detectron2.structures import Instances, Boxes, PolygonMasks
 import torch
-from scipy.stats import kurtosis, skew
+
+try:
+    from .contour_index import ContourIndex
+    from .contour_set import ContourSet, segment_reduce
+    from .cache import cached
+    from .drawing import box_polygons, circle_polygons, keypoint_arrays
+    from .masks import CroppedMasks
+    from .features import MomentAccumulator, annotation_regions
+    from .routes import RouteRenderer
+except ImportError:
+    from contour_index import ContourIndex
+    from contour_set import ContourSet, segment_reduce
+    from cache import cached
+    from drawing import box_polygons, circle_polygons, keypoint_arrays
+    from masks import CroppedMasks
+    from features import MomentAccumulator, annotation_regions
+    from routes import RouteRenderer
 
 
 STROKE_COLOR = (0, 255, 0)
 STROKE_THICKNESS = 5
 
+# contours more than this many blob diameters wide are the wall around a hold, not the hold
+MAX_HOLD_SIZE = 3
+
 EVALUATION_DATA = [
     "../data/bh/0000.jpg",
     "../data/bh/0457.jpg",
@@ -38,41 +62,52 @@ def contour_to_list(c):
         l.append(j.tolist()[0])
     return l
 
-def filter_straight_contours(contours, max_avg_error=5):
-    """
-    Filter out contours that are too close to lines.
+def _select_contours(contours, contour_set, keep):
+    """Return the kept contours, as a ContourSet if that is what was passed, else as a list."""
+    if isinstance(contours, ContourSet):
+        return contour_set.subset(keep)
 
-    @param max_avg_error: maximum average squared point-to-line error (in pixels)
-    """
-    contours = list(contours)
+    return [c for c, k in zip(contours, keep) if k]
 
-    def error_function(a, b, c):
-        error = 0
-        for x, y in contour_to_list(c):
-            error += (a * x + b - y) ** 2
+def _straight_mask(contour_set, max_avg_error):
+    """Return a mask of the contours that are too close to lines."""
+    points, offsets, lengths = contour_set.float_points(), contour_set.offsets, contour_set.lengths
+    n = np.maximum(lengths, 1)
 
-        return error / len(c)
+    mean = segment_reduce(np.add, points, offsets, lengths) / n[:, np.newaxis]
+    d = points - np.repeat(mean, lengths, axis=0)
+    dx, dy = d[:, 0], d[:, 1]
 
-    to_remove = []
-    for i, c in enumerate(contours):
-        points = np.asarray(contour_to_list(c))
+    sxx = segment_reduce(np.add, dx * dx, offsets, lengths)
+    syy = segment_reduce(np.add, dy * dy, offsets, lengths)
+    sxy = segment_reduce(np.add, dx * dy, offsets, lengths)
 
-        x = points[:,0]
-        y = points[:,1]
+    # the mean squared residual of the least squares line y = ax + b; a contour whose points all
+    # share the same x is a vertical line, so it is perfectly straight
+    with np.errstate(divide='ignore', invalid='ignore'):
+        error = np.where(sxx > 0, (syy - sxy ** 2 / sxx) / n, 0)
 
-        result = linregress(x, y)
+    return (error < max_avg_error) & (lengths > 0)
 
-        a, b = result.slope, result.intercept
+def _small_mask(contour_set, min_points, min_bb_area):
+    """Return a mask of the contours with too few points or too small bounding box."""
+    x1, y1, x2, y2 = contour_set.boxes.astype(np.int64).T
 
-        error = error_function(a, b, c)
+    return (contour_set.lengths < min_points) | ((x2 - x1) * (y2 - y1) < min_bb_area)
 
-        if error < max_avg_error:
-            to_remove.append(i)
+def filter_straight_contours(contours, max_avg_error=5):
+    """
+    Filter out contours that are too close to lines.
 
-    for r in reversed(to_remove):
-        del contours[r]
+    @param max_avg_error: maximum average squared point-to-line error (in pixels)
+    """
+    if not isinstance(contours, ContourSet):
+        contours = list(contours)
 
-    return contours
+    contour_set = ContourSet(contours)
+    straight = _straight_mask(contour_set, max_avg_error)
+
+    return _select_contours(contours, contour_set, ~straight)
 
 def filter_size_contours(contours, min_points=3, min_bb_area=125):
     """
@@ -81,37 +116,47 @@ def filter_size_contours(contours, min_points=3, min_bb_area=125):
     @param min_points: the minimum number of points a contour can have
     @param min_bb_area: the minimum area of a bounding box of a contour
     """
-    contours = list(contours)
+    if not isinstance(contours, ContourSet):
+        contours = list(contours)
 
-    to_remove = []
-    for i, c in enumerate(contours):
-        if len(c) < min_points:
-            to_remove.append(i)
-            continue
+    contour_set = ContourSet(contours)
+    small = _small_mask(contour_set, min_points, min_bb_area)
 
-        points = [j.tolist()[0] for j in c]
-        p = Polygon(points)
+    return _select_contours(contours, contour_set, ~small)
 
-        xl, yl, xh, yh = p.bounds
+@cached(depends=(_select_contours, _straight_mask, _small_mask))
+def filter_contours(contours, min_points=3, min_bb_area=125, max_avg_error=5):
+    """
+    Filter out contours by size and straightness at once (filter_size_contours followed by
+    filter_straight_contours, but packing the contours only once).
+    """
+    if not isinstance(contours, ContourSet):
+        contours = list(contours)
 
-        w = abs(xl - xh)
-        h = abs(yl - yh)
+    contour_set = ContourSet(contours)
+    small = _small_mask(contour_set, min_points, min_bb_area)
+    straight = _straight_mask(contour_set, max_avg_error)
 
-        if w * h < min_bb_area:
-            to_remove.append(i)
+    return _select_contours(contours, contour_set, ~(small | straight))
 
-    for r in reversed(to_remove):
-        del contours[r]
+# the writer used by process_image, set with set_image_writer (None to write synchronously)
+_image_writer = None
 
-    return contours
+def set_image_writer(writer):
+    """Set the ImageWriter that process_image writes through (None to write synchronously)."""
+    global _image_writer
+    _image_writer = writer
 
 def process_image(img, filename, save=True, scaling=0.5):
-    """Display or save an image."""
-    d = os.path.dirname(filename)
-
+    """Display or save an image (in the background, if an ImageWriter is set)."""
     if save:
-        if not os.path.exists(d):
-            os.mkdir(d)
+        if _image_writer is not None:
+            _image_writer.write(filename, img, scale=scaling)
+            return
+
+        d = os.path.dirname(filename)
+        if d != "":
+            os.makedirs(d, exist_ok=True)
 
         h, w = img.shape[:2]
 
@@ -125,55 +170,70 @@ def process_image(img, filename, save=True, scaling=0.5):
         cv.waitKey(0)
 
 def draw_keypoints(img, keypoints, color=STROKE_COLOR, thickness=STROKE_THICKNESS):
-    """Custom drawing of keypoints (since the OpenCV function doesn't support custom thickness)."""
-    for k in keypoints:
-        x, y = k.pt
-        cv.circle(img, (int(x), int(y)), int(k.size / 2), color=color, thickness=thickness)
+    """Custom drawing of keypoints (since the OpenCV function doesn't support custom thickness).
+
+    The circles are drawn as polygons by a single cv.polylines call (see Overlay for previews)."""
+    if len(keypoints) == 0:
+        return
+
+    centers, radii = keypoint_arrays(keypoints)
+    polygons = circle_polygons(centers, radii)
+    cv.polylines(img, list(polygons.reshape(len(polygons), -1, 1, 2)), True, color=color, thickness=thickness)
 
 def draw_contours(img, contours, color=STROKE_COLOR, thickness=STROKE_THICKNESS):
     """cv.drawContours with sane default."""
     cv.drawContours(img, contours, -1, color=color, thickness=thickness)
 
 def contour_to_box(contour):
-    min_x, min_y = float('inf'), float('inf')
-    max_x, max_y = 0, 0
+    """Return the (x1, y1, x2, y2) bounding box of a contour."""
+    points = np.reshape(contour, (-1, 2))
 
-    for x, y in contour_to_list(contour):
-        min_x = min(x, min_x)
-        min_y = min(y, min_y)
-        max_x = max(x, max_x)
-        max_y = max(y, max_y)
+    min_x, min_y = points.min(axis=0).tolist()
+    max_x, max_y = points.max(axis=0).tolist()
 
     return (min_x, min_y, max_x, max_y)
 
+def contour_boxes(contours):
+    """Return the (n, 4) array of bounding boxes of the contours (precomputed for a ContourSet)."""
+    if isinstance(contours, ContourSet):
+        return contours.boxes
+
+    return np.array([contour_to_box(c) for c in contours], dtype=np.int32).reshape(-1, 4)
+
 def contour_to_mask(img, contour):
     h, w = img.shape[:2]
     blank = np.zeros(shape=[h, w], dtype=np.uint8)
 
-    cv.fillPoly(blank, contour, color=(255, 255, 255))
+    cv.fillPoly(blank, [np.reshape(contour, (-1, 2))], color=(255, 255, 255))
 
     return blank
 
 def draw_contour_boxes(img, contours, color=STROKE_COLOR, thickness=STROKE_THICKNESS):
-    """cv.drawContours with sane default."""
-    for c in contours:
-        x1, y1, x2, y2 = contour_to_box(c)
-        cv.rectangle(img, (x1, y1), (x2, y2), color=color, thickness=thickness)
+    """Draw the bounding boxes of the contours with a single cv.polylines call."""
+    boxes = contour_boxes(contours)
+    if len(boxes) == 0:
+        return
+
+    cv.polylines(img, list(box_polygons(boxes).reshape(-1, 4, 1, 2)), True, color=color, thickness=thickness)
 
+@cached
 def gaussian_blur(img, size=13):
     """cv.GaussianBlur with sane default."""
     return cv.GaussianBlur(img, (size, size), 0)
 
+@cached
 def canny(img, parameters=(20, 25)):
     """cv.Canny with sane default."""
     return cv.Canny(img, *parameters)
 
-def find_contours(edges):
+@cached
+def find_contours(edges, offset=(0, 0)):
     """cv.findContours with sane default."""
-    contours, _ = cv.findContours(edges, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE)
+    contours, _ = cv.findContours(edges, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE, offset=offset)
 
     return contours
 
+@cached
 def simplify_contours(contours, epsilon=0.005):
     """Simplify contours using the cv.approxPolyDP function."""
     simplified = []
@@ -183,6 +243,9 @@ def simplify_contours(contours, epsilon=0.005):
         approx = cv.approxPolyDP(c, epsilon * peri, True)
         simplified.append(approx)
 
+    if isinstance(contours, ContourSet):
+        return ContourSet(simplified)
+
     return simplified
 
 def threshold(img, start=0, end=255):
@@ -190,6 +253,7 @@ def threshold(img, start=0, end=255):
     _, t = cv.threshold(img, start, end, cv.THRESH_BINARY)
     return t
 
+@cached
 def detect_blobs(img):
     """OpenCV simple blob detection with sane default."""
     params = cv.SimpleBlobDetector_Params()
@@ -209,86 +273,103 @@ def detect_blobs(img):
     detector = cv.SimpleBlobDetector_create(params)
     return detector.detect(img)
 
+def _point_contours(contour_set):
+    """Return the index of the contour each point of a ContourSet belongs to."""
+    return np.repeat(np.arange(len(contour_set)), contour_set.lengths)
+
 def get_nearby_contours(point, contours, distance):
-    """Return a list of contours any of whose points are close enough to the point."""
-    def is_close(p, c):
-        for pc in contour_to_list(c):
-            if dist(p, pc) < distance:
-                return True
-        return False
-
-    close = []
-    for c in contours:
-        if is_close(point, c):
-            close.append(c)
+    """Return a list of contours any of whose points are close enough to the point.
 
-    return close
+    @param contours: a list of contours, a ContourSet or a ContourIndex over them (much faster for
+    repeated queries)
+    """
+    if isinstance(contours, ContourIndex):
+        return contours.nearby(point, distance)
 
-def merge_blobs(keypoints, min_overlap = 0.15):
-    """Return a list of keypoints after merging those that overlap."""
+    if not isinstance(contours, ContourSet):
+        contours = list(contours)
 
-    merge_pairs = []
-    merge_set = set()
+    contour_set = ContourSet(contours)
+    d = np.hypot(*(contour_set.float_points() - point).T)
 
-    for i, k1 in enumerate(keypoints):
-        for j, k2 in enumerate(keypoints):
-            if i >= j:
-                continue
+    return [contours[i] for i in np.unique(_point_contours(contour_set)[d < distance])]
 
-            p1, p2, r1, r2 = k1.pt, k2.pt, k1.size / 2, k2.size / 2
+@cached
+def merge_blobs(keypoints, min_overlap = 0.15):
+    """Return a list of keypoints after merging those that overlap.
 
-            d = dist(p1, p2)
+    Overlaps are merged transitively, so a chain of overlapping blobs becomes a single keypoint.
+    """
+    if len(keypoints) < 2:
+        return keypoints
+
+    points = np.array([k.pt for k in keypoints], dtype=np.float64)
+    radii = np.array([k.size / 2 for k in keypoints], dtype=np.float64)
 
-            if d > r1 + r2:
-                continue
+    # candidate pairs are those within the largest possible overlap distance
+    i, j = cKDTree(points).query_pairs(2 * radii.max(), output_type='ndarray').T
 
-            overlap = d / (r1 + r2)
+    d = np.hypot(*(points[i] - points[j]).T)
+    r = radii[i] + radii[j]
 
-            if overlap > min_overlap:
-                merge_pairs.append((i, j))
-                merge_set.add(i)
-                merge_set.add(j)
+    overlapping = (d <= r) & (d / r > min_overlap)
+    i, j = i[overlapping], j[overlapping]
 
-    if len(merge_pairs) == 0:
+    if len(i) == 0:
         return keypoints
 
-    new_keypoints = []
+    graph = coo_matrix((np.ones(len(i)), (i, j)), shape=(len(keypoints), len(keypoints)))
+    _, labels = connected_components(graph, directed=False)
 
-    for i, j in merge_pairs:
-        k1 = keypoints[i]
-        k2 = keypoints[j]
+    clusters = defaultdict(list)
+    for idx, label in enumerate(labels):
+        clusters[label].append(idx)
+
+    new_keypoints = []
 
-        p1, p2, r1, r2 = k1.pt, k2.pt, k1.size / 2, k2.size / 2
-        d = dist(p1, p2)
+    for cluster in clusters.values():
+        if len(cluster) == 1:
+            continue
 
-        r_ratio = r1 / (r1 + r2)
+        # merge the blobs of the cluster one by one
+        p1, r1 = points[cluster[0]], radii[cluster[0]]
+        for idx in cluster[1:]:
+            p2, r2 = points[idx], radii[idx]
+            d = dist(p1, p2)
 
-        r_new = (r1 + r2 + d) / 2
-        x_new = p1[0] * r_ratio + p2[0] * (1 - r_ratio)
-        y_new = p1[1] * r_ratio + p2[1] * (1 - r_ratio)
+            r_ratio = r1 / (r1 + r2)
 
-        new_keypoints.append(cv.KeyPoint(x_new, y_new, r_new * 2))
+            r1 = (r1 + r2 + d) / 2
+            p1 = p1 * r_ratio + p2 * (1 - r_ratio)
 
-    for i, k in enumerate(keypoints):
-        if i in merge_set:
-            continue
+        new_keypoints.append(cv.KeyPoint(float(p1[0]), float(p1[1]), float(r1 * 2)))
 
-        new_keypoints.append(k)
+    for cluster in clusters.values():
+        if len(cluster) == 1:
+            new_keypoints.append(keypoints[cluster[0]])
 
     return new_keypoints
 
 def get_closest_contour(point, contours):
-    """Return the closest contour, given a point."""
-    closest = None
-    closest_distance = float('inf')
-    for c in contours:
-        for pc in contour_to_list(c):
-            d = dist(point, pc)
-            if d < closest_distance:
-                closest_distance = d
-                closest = c
+    """Return the closest contour, given a point.
+
+    @param contours: a list of contours, a ContourSet or a ContourIndex over them (much faster for
+    repeated queries)
+    """
+    if isinstance(contours, ContourIndex):
+        return contours.closest(point)
 
-    return closest
+    if not isinstance(contours, ContourSet):
+        contours = list(contours)
+
+    contour_set = ContourSet(contours)
+
+    if len(contour_set.points) == 0:
+        return None
+
+    d = np.hypot(*(contour_set.float_points() - point).T)
+
+    return contours[_point_contours(contour_set)[np.argmin(d)]]
 
 def point_to_line_distance(p1, p2, p3):
     """Return the distance from point p3 to a line defined by points p1 and p2."""
@@ -332,60 +413,309 @@ def point_to_contour_distance(point, contour):
 
     return min_d
 
-def squared_contour_error(contours_from, contour_to):
-    """Return the average squared error of distances of points from a list of contours to another contour."""
-    point_count = 0
-    contour_error = 0
+def points_to_contour_distances(points, contour, mode="segments", chunk_size=1024):
+    """
+    Return the distances from each of the points to a contour (a batched point_to_contour_distance).
+
+    @param points: an (n, 2) array of points
+    @param mode: "segments" computes all point-segment distances by broadcasting, "distance_transform"
+    rasterises the contour once (in the bounding box of the contour and the points) and looks the
+    distances up, which is accurate to about a pixel
+    @param chunk_size: the number of points processed at once in the "segments" mode, which caps
+    the memory used to chunk_size * (contour length) distances
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    c = np.asarray(contour, dtype=np.float64).reshape(-1, 2)
 
-    for c in contours_from:
-        point_count += len(c)
+    # like point_to_contour_distance, the contour is not closed and zero-length segments are skipped
+    a, b = c[:-1], c[1:]
+    lengths = np.hypot(*(b - a).T)
+    a, b, lengths = a[lengths > 0], b[lengths > 0], lengths[lengths > 0]
 
-        for pc in contour_to_list(c):
-            contour_error += point_to_contour_distance(pc, contour_to)
+    if len(a) == 0:
+        return np.full(len(points), float('inf'))
 
-    return contour_error / point_count
+    if mode == "segments":
+        # normalized tangent vectors
+        d = (b - a) / lengths[:, np.newaxis]
 
-def detect_holds(img, keypoints, contours, threshold_step=5):
-    """Detect holds by combining blob and edge detection."""
-    # pre-compute thresholds and contours/edges since they're used repeatedly
-    blur = gaussian_blur(img)
+        distances = np.empty(len(points))
+        for i in range(0, len(points), chunk_size):
+            p = points[i:i + chunk_size, np.newaxis, :]
 
-    thresholds = {}
-    for i in range(0, 255, threshold_step):
-        t = threshold(blur, i, 255)
-        thresholds[i] = []
+            # signed parallel distance components
+            s = np.sum((a - p) * d, axis=2)
+            t = np.sum((p - b) * d, axis=2)
 
-        for c_t in t[:,:,0], t[:,:,1], t[:,:,2]:
-            t_edges = canny(c_t)
-            t_contours = find_contours(t_edges)
-            t_contours = simplify_contours(t_contours)
+            # clamped parallel distance
+            h = np.maximum(np.maximum(s, t), 0)
 
-            thresholds[i].append((t_edges, t_contours))
+            # perpendicular distance component
+            pa = p - a
+            perpendicular = pa[:, :, 0] * d[:, 1] - pa[:, :, 1] * d[:, 0]
 
-    hold_approximations = {}
+            distances[i:i + chunk_size] = np.min(np.hypot(h, perpendicular), axis=1)
+
+        return distances
+    elif mode == "distance_transform":
+        all_points = np.concatenate([c, points])
+        x1, y1 = np.floor(all_points.min(axis=0)).astype(int) - 1
+        x2, y2 = np.ceil(all_points.max(axis=0)).astype(int) + 2
+
+        # the distance transform measures the distance to the nearest zero pixel
+        canvas = np.full((y2 - y1, x2 - x1), 255, dtype=np.uint8)
+        polyline = np.round(c - (x1, y1)).astype(np.int32)
+        cv.polylines(canvas, [polyline], False, color=0, thickness=1)
+
+        dt = cv.distanceTransform(canvas, cv.DIST_L2, cv.DIST_MASK_PRECISE)
+
+        xs, ys = np.round(points - (x1, y1)).astype(int).T
+        return dt[ys, xs].astype(np.float64)
+    else:
+        raise ValueError(f"Unknown distance mode: {mode}")
+
+def squared_contour_error(contours_from, contour_to, mode="segments"):
+    """Return the average squared error of distances of points from a list of contours to another contour.
+
+    @param mode: the points_to_contour_distances mode
+    """
+    points = np.concatenate([np.reshape(c, (-1, 2)) for c in contours_from] + [np.empty((0, 2))])
+    contour_error = np.sum(points_to_contour_distances(points, contour_to, mode))
+
+    return float(contour_error) / len(points)
+
+def _share_image(img, executor):
+    """Return the image as passed to the workers of an executor (through shared memory for process
+    pools, so it isn't pickled for every task) and the shared memory to release afterwards."""
+    if not isinstance(executor, ProcessPoolExecutor):
+        return img, None
+
+    shm = shared_memory.SharedMemory(create=True, size=max(img.nbytes, 1))
+    np.ndarray(img.shape, img.dtype, buffer=shm.buf)[:] = img
+
+    return (shm.name, img.shape, img.dtype.str), shm
+
+def _attach_image(img):
+    """Return the array of an image passed by _share_image and the shared memory to close afterwards."""
+    if not isinstance(img, tuple):
+        return img, None
+
+    name, shape, dtype = img
+    shm = shared_memory.SharedMemory(name=name)
+
+    return np.ndarray(shape, dtype, buffer=shm.buf), shm
+
+def _best_contour(holds, candidates, distance_mode, expired=None):
+    """Return the (error, contour) of the candidate contour fitting each hold best (stopping early,
+    with fewer results, once expired returns True)."""
+    best = []
+    for (_, _, nearby_contours), contour in zip(holds, candidates):
+        if expired is not None and expired():
+            break
+
+        if contour is None:
+            best.append((float('inf'), None))
+        else:
+            # copy, so that the contour doesn't keep the buffer of all contours of its level alive
+            best.append((squared_contour_error(nearby_contours, contour, distance_mode), np.array(contour)))
+
+    return best
+
+def _planes(img):
+    """Return the channels of an image as a contiguous (channels, height, width) array."""
+    return np.ascontiguousarray(np.moveaxis(img, 2, 0))
+
+def _sweep_level(planes, i, holds, distance_mode, offset=(0, 0), expired=None):
+    """Threshold the image at level i and return the best (error, contour) of each hold, per channel.
+
+    Only one thresholded channel and its edges exist at a time, and only the compact contours are
+    kept while they are searched.
+
+    @param planes: the (blurred) image, as returned by _planes
+    @param offset: the position of the image in the coordinates of the holds
+    @param expired: a function checked before each channel and each hold (optional); once it
+    returns True, the results stop there (fewer channels, and fewer holds in the last channel)
+    """
+    planes, shm = _attach_image(planes)
+
+    try:
+        results = []
+        for plane in planes:
+            if expired is not None and expired():
+                break
+
+            # the per-level results are not worth caching, so the stages are called undecorated
+            t_edges = canny.__wrapped__(threshold(plane, i, 255))
+            t_contours = find_contours.__wrapped__(t_edges, offset)
+            del t_edges
+
+            t_contours = ContourIndex(simplify_contours.__wrapped__(ContourSet(t_contours)))
+
+            candidates = [get_closest_contour(pt, t_contours) for pt, _, _ in holds]
+            results.append(_best_contour(holds, candidates, distance_mode, expired))
+
+        return results
+    finally:
+        if shm is not None:
+            shm.close()
+
+def _hold_rois(holds, shape):
+    """
+    Return the regions of interest of the holds, as a list of ((x1, y1, x2, y2), hold indices).
+
+    The region of a hold is the box centred on its keypoint that fits the largest contour that
+    can be a hold; overlapping regions are merged, so that no pixel is processed twice.
+    """
+    h, w = shape[:2]
+
+    boxes = np.empty((len(holds), 4), dtype=np.int64)
+    for idx, (pt, size, _) in enumerate(holds):
+        r = MAX_HOLD_SIZE * size / 2
+        boxes[idx] = (max(int(pt[0] - r), 0), max(int(pt[1] - r), 0), min(int(pt[0] + r) + 1, w), min(int(pt[1] + r) + 1, h))
+
+    # the region of each hold
+    labels = np.arange(len(holds))
+
+    # a merged region can overlap regions that none of its parts overlapped, so the overlapping
+    # regions are merged until there are none left
+    while len(boxes) > 1:
+        centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+        extents = boxes[:, 2:] - boxes[:, :2]
+
+        # candidate pairs are those whose centres are closer than the largest region
+        i, j = cKDTree(centers).query_pairs(extents.max(), p=np.inf, output_type='ndarray').T
+
+        overlapping = np.all((boxes[i, :2] < boxes[j, 2:]) & (boxes[j, :2] < boxes[i, 2:]), axis=1)
+        i, j = i[overlapping], j[overlapping]
+
+        if len(i) == 0:
+            break
+
+        graph = coo_matrix((np.ones(len(i)), (i, j)), shape=(len(boxes), len(boxes)))
+        n, region_labels = connected_components(graph, directed=False)
+
+        merged = np.empty((n, 4), dtype=np.int64)
+        merged[:, :2] = np.iinfo(np.int64).max
+        merged[:, 2:] = np.iinfo(np.int64).min
+        np.minimum.at(merged[:, :2], region_labels, boxes[:, :2])
+        np.maximum.at(merged[:, 2:], region_labels, boxes[:, 2:])
+
+        boxes = merged
+        labels = region_labels[labels]
+
+    rois = defaultdict(list)
+    for idx, label in enumerate(labels.tolist()):
+        rois[label].append(idx)
+
+    return [(tuple(boxes[label].tolist()), idx) for label, idx in rois.items()]
+
+def _roi_search(img, box, levels, holds, distance_mode):
+    """Sweep the thresholds of a region of interest only, returning the best (error, contour) of
+    each hold, per level and channel (in image coordinates)."""
+    img, shm = _attach_image(img)
+
+    try:
+        x1, y1, x2, y2 = box
+        h, w = img.shape[:2]
+
+        # pad the crop so that the blur of the region is the same as the blur of the whole image
+        pad = 13 // 2
+        px1, py1, px2, py2 = max(x1 - pad, 0), max(y1 - pad, 0), min(x2 + pad, w), min(y2 + pad, h)
+
+        blur = gaussian_blur.__wrapped__(img[py1:py2, px1:px2])
+        planes = _planes(blur[y1 - py1:y2 - py1, x1 - px1:x2 - px1])
+
+        return [_sweep_level(planes, i, holds, distance_mode, offset=(x1, y1)) for i in levels]
+    finally:
+        if shm is not None:
+            shm.close()
+
+@cached(keyed_by="keypoints", depends=(
+    threshold, canny, find_contours, simplify_contours, gaussian_blur, get_nearby_contours,
+    get_closest_contour, points_to_contour_distances, squared_contour_error, _best_contour,
+    _planes, _sweep_level, _hold_rois, _roi_search
+))
+def detect_holds(img, keypoints, contours, threshold_step=5, backend="sweep", distance_mode="segments",
+                 executor=None):
+    """
+    Detect holds by combining blob and edge detection.
+
+    Memory use doesn't grow with the number of threshold levels: the sweep keeps about 2x the image
+    plus the contours of one channel per level in progress (see std/benchmark_memory.py).
+
+    @param threshold_step: the step between the tried threshold levels
+    @param backend: "sweep" thresholds the whole image at every level and searches all resulting
+    contours, "roi" sweeps the thresholds only in the regions around the keypoints (which is much
+    less work when the holds cover a small part of the image, but ignores contours crossing the
+    region boundary)
+    @param distance_mode: the points_to_contour_distances mode used to compare the contours
+    @param executor: a concurrent.futures executor to run the threshold levels (sweep) or the
+    regions (roi) on, or None to run serially; thread pools work well since OpenCV releases the
+    GIL, process pools get the image through shared memory. The result does not depend on the
+    executor.
+    """
+    levels = range(0, 255, threshold_step)
+
+    contours = ContourIndex(contours)
+
+    # keypoints are passed to the workers as plain tuples, since cv.KeyPoint can't be pickled
+    hold_keypoints, holds = [], []
     for k in keypoints:
         nearby_contours = get_nearby_contours(k.pt, contours, (k.size / 2))
 
         if len(nearby_contours) == 0:
             continue
 
-        best_contour = None
-        best_contour_error = float('inf')
+        hold_keypoints.append(k)
+        holds.append((k.pt, k.size, nearby_contours))
+
+    map_function = map if executor is None else executor.map
 
-        # find optimal threshold
-        for i in range(0, 255, threshold_step):
-            for t_edges, t_contours in thresholds[i]:
-                closest_t_contour = get_closest_contour(k.pt, t_contours)
+    if backend == "roi":
+        shared_img, shm = _share_image(img, executor)
+    else:
+        shared_img, shm = _share_image(_planes(gaussian_blur(img)), executor)
+
+    # the best (error, (level index, channel), contour) of each hold; equally good contours are
+    # resolved by the position in the serial order, so that the order of the results doesn't matter
+    best = [(float('inf'), (float('inf'),), None)] * len(holds)
+
+    def merge(hold_indices, level_idx, channel, channel_results):
+        for h, (err, contour) in zip(hold_indices, channel_results):
+            if err < best[h][0] or (err == best[h][0] and (level_idx, channel) < best[h][1]):
+                best[h] = (err, (level_idx, channel), contour)
+
+    # the results are merged as they arrive, so only the best contours are kept
+    try:
+        if backend == "sweep":
+            level_results = map_function(
+                _sweep_level, repeat(shared_img), levels, repeat(holds), repeat(distance_mode)
+            )
 
-                if closest_t_contour is None:
-                    continue
+            for level_idx, channel_results in enumerate(level_results):
+                for channel, r in enumerate(channel_results):
+                    merge(range(len(holds)), level_idx, channel, r)
+        elif backend == "roi":
+            rois = _hold_rois(holds, img.shape)
 
-                err = squared_contour_error(nearby_contours, closest_t_contour)
+            roi_results = map_function(
+                _roi_search, repeat(shared_img), [box for box, _ in rois], repeat(levels),
+                [[holds[i] for i in idx] for _, idx in rois], repeat(distance_mode)
+            )
 
-                if best_contour_error > err:
-                    best_contour_error = err
-                    best_contour = closest_t_contour
+            for (_, hold_indices), level_results in zip(rois, roi_results):
+                for level_idx, channel_results in enumerate(level_results):
+                    for channel, r in enumerate(channel_results):
+                        merge(hold_indices, level_idx, channel, r)
+        else:
+            raise ValueError(f"Unknown detect_holds backend: {backend}")
+    finally:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
 
+    hold_approximations = {}
+    for k, (_, _, best_contour) in zip(hold_keypoints, best):
         if best_contour is None:
             continue
 
@@ -393,23 +723,129 @@ def detect_holds(img, keypoints, contours, threshold_step=5):
 
     return hold_approximations
 
-def to_detectron_format(img, contours):
+def _coarse_to_fine(levels):
+    """Return the levels reordered so that every prefix covers the range as evenly as possible."""
+    levels = list(levels)
+
+    stride = 1
+    while stride * 2 < len(levels):
+        stride *= 2
+
+    order, seen = [], set()
+    while stride >= 1:
+        for idx in range(0, len(levels), stride):
+            if idx not in seen:
+                seen.add(idx)
+                order.append(idx)
+        stride //= 2
+
+    return [(idx, levels[idx]) for idx in order]
+
+def detect_holds_anytime(img, keypoints, contours, time_budget, threshold_step=5, distance_mode="segments"):
+    """
+    Detect holds like detect_holds (with the sweep backend), but return the best contours found so
+    far once the time budget runs out.
+
+    The threshold levels are searched coarse to fine, halving the stride between them (with the
+    default 51 levels, every 32nd level first, then every 16th, every 8th, ..., i.e. the level
+    indices 0, 32, 16, 48, 8, 24, 40, ...), and within each level the keypoints are searched from
+    the largest blob down, so an interrupted search has a coarse answer for as many holds as
+    possible. The budget is checked
+    before each level, channel and keypoint, so it is overrun by at most the thresholding, edge
+    and contour extraction of one channel. A complete search returns the same contours as
+    detect_holds.
+
+    @param time_budget: the time (in seconds) after which no more work is started
+    @return: the {keypoint: contour} dictionary and a report dictionary with whether the search is
+    "complete", the "elapsed" time, the number of "levels" searched for all keypoints out of
+    "total_levels", and the number of levels "searched" for each keypoint
+    """
+    start = time.perf_counter()
+
+    def expired():
+        return time.perf_counter() - start > time_budget
+
+    planes = _planes(gaussian_blur(img))
+    levels = _coarse_to_fine(range(0, 255, threshold_step))
+
+    contours = ContourIndex(contours)
+
+    hold_keypoints, holds = [], []
+    for k in sorted(keypoints, key=lambda k: k.size, reverse=True):
+        nearby_contours = get_nearby_contours(k.pt, contours, (k.size / 2))
+
+        if len(nearby_contours) != 0:
+            hold_keypoints.append(k)
+            holds.append((k.pt, k.size, nearby_contours))
+
+    # the best (error, (level index, channel), contour) of each hold; equally good contours are
+    # resolved by the position in the serial order, so that a complete search matches detect_holds
+    best = [(float('inf'), (float('inf'),), None)] * len(holds)
+    searched = [0] * len(holds)
+
+    complete_levels = 0
+    for level_idx, i in levels:
+        if expired():
+            break
+
+        # the budget is also checked between the channels and the holds of the level
+        channel_results = _sweep_level(planes, i, holds, distance_mode, expired=expired)
+
+        for channel, results in enumerate(channel_results):
+            for h, (err, contour) in enumerate(results):
+                if err < best[h][0] or (err == best[h][0] and (level_idx, channel) < best[h][1]):
+                    best[h] = (err, (level_idx, channel), contour)
+
+        # a hold is searched at a level once all of its channels are
+        n_searched = len(channel_results[-1]) if len(channel_results) == planes.shape[0] else 0
+        for h in range(n_searched):
+            searched[h] += 1
+
+        if n_searched < len(holds):
+            break
+
+        complete_levels += 1
+
+    hold_approximations = {}
+    for k, (_, _, contour) in zip(hold_keypoints, best):
+        if contour is not None:
+            hold_approximations[k] = contour
+
+    report = {
+        "complete": complete_levels == len(levels),
+        "elapsed": time.perf_counter() - start,
+        "levels": complete_levels,
+        "total_levels": len(levels),
+        "searched": dict(zip(hold_keypoints, searched)),
+    }
+
+    return hold_approximations, report
+
+def to_detectron_format(img, contours, mask_format="dense"):
     """Convert the contours of holds to a format that is parsable by detectron.
-    https://detectron2.readthedocs.io/en/latest/tutorials/models.html#model-output-format"""
+    https://detectron2.readthedocs.io/en/latest/tutorials/models.html#model-output-format
+
+    @param mask_format: "dense" stores an (n, height, width) mask tensor, "cropped" stores the
+    masks cropped to their boxes (see CroppedMasks, which densifies them one at a time when
+    iterated), "polygon" stores the contours as detectron2 PolygonMasks
+    """
     h, w = img.shape[:2]
 
     instances = Instances((h, w))
 
-    boxes = []
-    for c in contours:
-        boxes.append(contour_to_box(c))
+    boxes = contour_boxes(contours)
 
-    masks = []
-    for c in contours:
-        masks.append(contour_to_mask(img, c))
+    if mask_format == "dense":
+        masks = torch.tensor(np.array([contour_to_mask(img, c) for c in contours]).reshape(-1, h, w))
+    elif mask_format == "cropped":
+        masks = CroppedMasks.from_contours(contours, boxes, (h, w))
+    elif mask_format == "polygon":
+        masks = PolygonMasks([[np.reshape(c, -1).astype(np.float64)] for c in contours])
+    else:
+        raise ValueError(f"Unknown mask format: {mask_format}")
 
-    instances.set("pred_boxes", Boxes(torch.tensor(boxes)))
-    instances.set("pred_masks", torch.tensor(masks))
+    instances.set("pred_boxes", Boxes(torch.tensor(boxes.tolist()).reshape(-1, 4)))
+    instances.set("pred_masks", masks)
 
     return instances
 
@@ -446,90 +882,86 @@ def plot_result(image, contours, df_mean_color):
     plt.imshow(cv.cvtColor(img, cv.COLOR_BGR2RGB) )
     plt.axis('off')
 
-def plot_routes(routes: List, d_dict):
+def plot_routes(routes: List, d_dict, output_dir=None, scale=1.0):
+    """Plot the image of each route next to the original (see RouteRenderer).
+
+    @param output_dir: if given, the route images are written to this directory instead of plotted
+    @param scale: the scale of the route images
+    """
     image_bgr = cv.imread(d_dict["file_name"])
-    for k, holds in routes.items():
-        height = d_dict["height"]
-        width = d_dict["width"]
-        final_bitmask = np.zeros((height, width))
-        for hold_id in holds:
-            hold_poly = d_dict["annotations"][hold_id]
-            points = np.array(hold_poly["segmentation"])
-            points = points.reshape((-1, 2)).astype(np.int32)
-            points = points[np.newaxis, :]
-            bitmask = cv.fillPoly(np.zeros(image_bgr.shape[:2]), points, 255).astype(
-                np.uint8
-            )
-            final_bitmask = final_bitmask + bitmask
-        final_bitmask = final_bitmask.astype(np.bool8).astype(np.float32)
-        img = image_bgr.transpose((2, 0, 1))
-        masked_output = img * final_bitmask
-        img_routes = masked_output.astype(np.int32).transpose((1, 2, 0))
+    renderer = RouteRenderer.from_annotations(image_bgr, d_dict)
+
+    if output_dir is not None:
+        return renderer.write_routes(routes, output_dir, scale)
+
+    renderer = renderer.scaled(scale)
+    for _, img_routes in renderer.render_routes(routes):
         fig, ax = plt.subplots(ncols=2)
         ax[0].imshow(img_routes[:, :, ::-1])
-        ax[1].imshow(image_bgr[:, :, ::-1])
+        ax[1].imshow(renderer.image[:, :, ::-1])
 
 # Masked versions of color moments https://en.wikipedia.org/wiki/Color_moments
+def _masked_moments(image, mask):
+    """Return the MomentAccumulator of the pixels of an image inside a mask."""
+    values = image[mask > 0].reshape(np.count_nonzero(mask), -1)
+
+    moments = MomentAccumulator(1, values.shape[1])
+    moments.add(np.zeros(len(values), dtype=np.int64), values)
+
+    return moments
+
 def masked_skewness(image, mask):
-    np_image = np.transpose(image, (2, 0, 1)).astype("float64")
-    mask_3 = np.array([mask, mask, mask])
-    np_mask = np.ma.make_mask(mask_3)
-    np_image = np.ma.array(np_image, mask=np_mask)
-    image_raveled = np.ma.reshape(np_image, (3, -1))
-    return skew(image_raveled, axis=1)
+    """Return the skewness of each channel of the pixels inside the mask."""
+    return _masked_moments(image, mask).skewness()[0]
 
-# Masked versions of color moments https://en.wikipedia.org/wiki/Color_moments
 def masked_kurtosis(image, mask):
-    np_image = np.transpose(image, (2, 0, 1)).astype("float64")
-    mask_3 = np.array([mask, mask, mask])
-    np_mask = np.ma.make_mask(mask_3)
-    np_image = np.ma.array(np_image, mask=np_mask)
-    image_raveled = np.ma.reshape(np_image, (3, -1))
-    return kurtosis(image_raveled, axis=1)
-
-def get_color_moments(image, d_dict):
-    color_moments = defaultdict(list)
-    for idx, poly in enumerate(d_dict["annotations"]):
-        if poly["category_id"] == 1:
-        # Volumes are considered part of the wall, not part of a route -> skip
-            continue
-        points = np.array(poly["segmentation"])
-        points = points.reshape((-1, 2)).astype(np.int32)
-        points = points[np.newaxis, :]
-        mask = cv.fillPoly(np.zeros(image.shape[:2]), points, 255).astype(np.uint8)
-        mean_v, std_v = cv.meanStdDev(image, mask=mask)
-        # skew_v = masked_skewness(image, mask)
-        # kurtosis_v = masked_kurtosis(image, mask)
-        color_moments[idx].extend(mean_v[0:1, 0])
-        color_moments[idx].extend(std_v[0:1, 0])
-        # color_moments[idx].extend(skew_v[0:3])
-        # color_moments[idx].extend(kurtosis_v[0:3])
-
-    color_moment_arr = np.array(list(color_moments.values()))
+    """Return the excess kurtosis of each channel of the pixels inside the mask."""
+    return _masked_moments(image, mask).kurtosis()[0]
+
+COLOR_MOMENTS = ("mean", "std", "skewness", "kurtosis")
+
+def get_color_moments(image, d_dict, moments=("mean", "std"), channels=(0,), color_space=None,
+                      return_indices=False):
+    """Return the normalized color moments of each hold (volumes are skipped), by default the mean
+    and std of the first channel.
+
+    All holds are computed in a single pass over their pixels (see RegionPixels).
+
+    @param moments: the moments to compute, among COLOR_MOMENTS
+    @param channels: the channels whose moments are computed
+    @param color_space: a cv.cvtColor conversion code to apply to the hold pixels first (e.g.
+    cv.COLOR_BGR2LAB)
+    @param return_indices: also return the annotation index of each row, since the rows skip the
+    volumes (e.g. for RouteClusters.routes, whose routes are then as expected by plot_routes)
+    """
+    for m in moments:
+        if m not in COLOR_MOMENTS:
+            raise ValueError(f"Unknown color moment: {m}")
+
+    regions, indices = annotation_regions(image.shape, d_dict)
+    accumulator = regions.moments(image, color_space)
+
+    # one column per moment and channel, grouped by moment
+    channels = list(channels)
+    color_moment_arr = np.concatenate([getattr(accumulator, m)()[:, channels] for m in moments], axis=1)
+
     color_moments_arr_norm = color_moment_arr - np.mean(color_moment_arr, axis=0)
     color_moments_arr_norm = color_moments_arr_norm / np.std(color_moments_arr_norm, axis=0)
+
+    if return_indices:
+        return color_moments_arr_norm, indices
     return color_moments_arr_norm
 
 def get_histograms(image, d_dict):
-    histograms = defaultdict(list)
-    for idx, poly in enumerate(d_dict["annotations"]):
-        if poly["category_id"] == 1:
-        # Volumes are considered part of the wall, not part of a route -> skip
-            continue
-        points = np.array(poly["segmentation"])
-        points = points.reshape((-1, 2)).astype(np.int32)
-        points = points[np.newaxis, :]
-        mask = cv.fillPoly(np.zeros(image.shape[:2]), points, 255).astype(np.uint8)
-        hist0 = cv.calcHist([image], [0], mask=mask, histSize=[256], ranges=[0, 256])
-        hist1 = cv.calcHist([image], [1], mask=mask, histSize=[256], ranges=[0, 256])
-        hist2 = cv.calcHist([image], [2], mask=mask, histSize=[256], ranges=[0, 256])
-        hist = np.array([hist0])
-        histograms[idx] = hist.flatten()
-
-    histograms_arr = np.array(list(histograms.values()))
+    """Return the normalized 256 bin histogram of the first channel of each hold (volumes are skipped).
+
+    All holds are computed in a single pass over their pixels (see RegionPixels)."""
+    regions, _ = annotation_regions(image.shape, d_dict)
+
+    histograms_arr = regions.histograms(image, channel=0)
+
     histograms_arr_norm = histograms_arr - np.mean(histograms_arr, axis=0)
     histograms_arr_norm = np.nan_to_num(
     histograms_arr_norm / np.std(histograms_arr_norm, axis=0)
     )
     return histograms_arr_norm
-